@@ -0,0 +1,359 @@
+"""Canned data and fakes shared by the offline benchmarks, no network or Discord connection is needed"""
+
+from __future__ import annotations
+
+import array
+import asyncio
+import math
+import pathlib
+import shutil
+import string
+import subprocess
+import threading
+import time
+import wave
+import zlib
+
+import discord
+
+from utils import audio
+from utils import extraction
+from utils import ytdl_utils
+
+SAMPLE_RATE = 48000
+
+# A trimmed down copy of a real yt-dlp info dict, the sizes of the fields are the ones that matter
+info_dict = {
+    "id": "dQw4w9WgXcQ",
+    "url": "https://rr3---sn-example.googlevideo.com/videoplayback?expire=4102444800&itag=251&mime=audio%2Fwebm"
+           "&source=youtube&requiressl=yes&sig=" + "A" * 220,
+    "title": "Rick Astley - Never Gonna Give You Up (Official Music Video)",
+    "description": ("The official video for “Never Gonna Give You Up” by Rick Astley. "
+                    + string.ascii_letters * 4) * 12,
+    "thumbnail": "https://i.ytimg.com/vi/dQw4w9WgXcQ/maxresdefault.jpg",
+    "like_count": 17000000,
+    "view_count": 1500000000,
+    "duration_string": "3:33",
+    "duration": 213,
+    "upload_date": "20091025",
+    "uploader": "Rick Astley",
+    "uploader_url": "https://www.youtube.com/@RickAstleyYT",
+    "acodec": "opus",
+    "ext": "webm",
+    "formats": [{"format_id": str(index), "url": "https://example.googlevideo.com/" + "f" * 400,
+                 "http_headers": {"User-Agent": "Mozilla/5.0"}} for index in range(30)]
+}
+
+
+def make_info(index: int) -> dict:
+    """Returns a copy of the canned info dict with unique strings, like the extractor would"""
+
+    info = {key: (f"{value}{index}" if isinstance(value, str) else value) for key, value in info_dict.items()}
+    info["id"] = f"{index:011d}"
+
+    return info
+
+
+def make_record(index: int, stream_url: str | None = None, codec: str | None = None,
+                duration: int | None = None) -> dict:
+    """Returns the trimmed extraction record of a canned video, optionally pointing to a local stream"""
+
+    record = extraction.make_record(make_info(index))
+    # The commands parse the date, it must stay valid
+    record["upload_date"] = info_dict["upload_date"]
+
+    if duration is not None:
+        record["duration"] = duration
+        record["duration_string"] = f"{duration // 60}:{duration % 60:02d}"
+
+    if stream_url is not None:
+        record["url"] = stream_url
+        record["acodec"] = codec
+
+    return record
+
+
+def write_wav(path: str | pathlib.Path, seconds: float = 10.0, frequency: float = 440.0) -> pathlib.Path:
+    """
+    Writes a 48 kHz stereo sine wave, the format Discord expects, to stand in for a stream.
+    """
+    path = pathlib.Path(path)
+    sample_count = int(seconds * SAMPLE_RATE)
+
+    samples = array.array("h")
+    for index in range(sample_count):
+        value = int(12000 * math.sin(2 * math.pi * frequency * index / SAMPLE_RATE))
+        samples.extend((value, value))
+
+    with wave.open(str(path), "wb") as file:
+        file.setnchannels(2)
+        file.setsampwidth(2)
+        file.setframerate(SAMPLE_RATE)
+        file.writeframes(samples.tobytes())
+
+    return path
+
+
+def write_opus(path: str | pathlib.Path, wav: str | pathlib.Path) -> pathlib.Path | None:
+    """Encodes the WAV fixture to Opus, None if ffmpeg is not installed"""
+
+    if not has_ffmpeg():
+        return None
+
+    subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-i", str(wav), "-c:a", "libopus",
+                    str(path)], check=True)
+
+    return pathlib.Path(path)
+
+
+def has_ffmpeg() -> bool:
+    return shutil.which("ffmpeg") is not None
+
+
+class WavPCM(discord.AudioSource):
+    """
+    Reads the frames of a WAV file directly, in place of :class:`discord.FFmpegPCMAudio` when ffmpeg is missing.
+    """
+
+    def __init__(self, path: str | pathlib.Path):
+        self._file = wave.open(str(path), "rb")
+
+    def read(self) -> bytes:
+        data = self._file.readframes(audio.FRAME_SIZE // 4)
+
+        return data if len(data) == audio.FRAME_SIZE else b""
+
+    def cleanup(self):
+        self._file.close()
+
+
+class FakeExtractionBackend:
+    """
+    Stands in for the yt-dlp extraction backends, answering with canned records after an optional delay.
+
+    Attributes:
+        stream_url: :class:`str`: The stream every record points to, may contain an **{id}** placeholder.
+
+        codec:  :class:`str`: The codec of the stream.
+
+        delay:  :class:`float`: The simulated extraction time, in seconds.
+
+        duration:   :class:`int`: The duration given to every video, None to keep the canned one.
+
+    """
+
+    def __init__(self, stream_url: str | None = None, codec: str | None = None, delay: float = 0.0,
+                 duration: int | None = None):
+        self.stream_url = stream_url
+        self.codec = codec
+        self.delay = delay
+        self.duration = duration
+        self.calls = 0
+
+    async def start(self):
+        pass
+
+    async def extract(self, url: str, download: bool = False) -> dict:
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+
+        video_id = ytdl_utils.parse_video_id(url)
+        record = make_record(zlib.crc32(url.encode()), self.stream_url, self.codec, self.duration)
+        if video_id is not None:
+            record["id"] = video_id
+            if self.stream_url is not None:
+                record["url"] = self.stream_url.format(id=video_id)
+
+        return record
+
+    def shutdown(self):
+        pass
+
+
+class FakeChannel:
+    """A voice channel, connecting to it gives the guild a :class:`FakeVoiceClient`"""
+
+    def __init__(self, channel_id: int, guild: FakeGuild | None = None):
+        self.id = channel_id
+        self.guild = guild
+
+    async def connect(self) -> FakeVoiceClient:
+        self.guild.voice_client = FakeVoiceClient(channel=self)
+
+        return self.guild.voice_client
+
+
+class FakeVoiceClient:
+    """
+    Plays the sources like discord's audio player thread: one frame every 20 ms, or as fast as possible.
+
+    Attributes:
+        realtime:   :class:`bool`: Whether the frames are pulled at real-time speed.
+
+        frames: :class:`int`: The number of frames read since the client was created.
+
+        gaps:   :class:`list[float]`: The time between the end of a track and the start of the next one.
+
+        underruns:  :class:`int`: The number of frames of silence the read-ahead buffers had to return.
+
+    """
+
+    def __init__(self, realtime: bool = True, channel: FakeChannel | None = None):
+        self.realtime = realtime
+        self.channel = channel or FakeChannel(0)
+        self.frames = 0
+        self.gaps: list[float] = []
+        self.underruns = 0
+
+        self.source: discord.AudioSource | None = None
+        self._thread: threading.Thread | None = None
+        self._stopped = threading.Event()
+        self._resumed = threading.Event()
+        self._resumed.set()
+        self._ended: float | None = None
+
+    def play(self, source: discord.AudioSource, *, after=None):
+        if self._ended is not None:
+            self.gaps.append(time.perf_counter() - self._ended)
+            self._ended = None
+
+        self.source = source
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(source, self._stopped, after), daemon=True)
+        self._thread.start()
+
+    def _run(self, source: discord.AudioSource, stopped: threading.Event, after):
+        start = time.perf_counter()
+        count = 0
+
+        while not stopped.is_set():
+            self._resumed.wait()
+
+            data = source.read()
+            if not data:
+                break
+
+            count += 1
+            self.frames += 1
+
+            if self.realtime:
+                delay = start + count * audio.FRAME_DURATION - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+        source.cleanup()
+
+        # The read-ahead buffer is somewhere down the chain of transformers
+        inner = source
+        while inner is not None and not isinstance(inner, audio.BufferedAudio):
+            inner = getattr(inner, "original", None)
+        if inner is not None:
+            self.underruns += inner.underruns
+
+        if self.source is source:
+            self.source = None
+            self._ended = time.perf_counter()
+
+        if after is not None:
+            after(None)
+
+    def wait(self, timeout: float | None = None):
+        """Waits for the current track to end"""
+
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def is_playing(self) -> bool:
+        return self.source is not None and self._resumed.is_set()
+
+    def is_paused(self) -> bool:
+        return self.source is not None and not self._resumed.is_set()
+
+    def pause(self):
+        self._resumed.clear()
+
+    def resume(self):
+        self._resumed.set()
+
+    def stop(self):
+        if self.source is not None:
+            self._ended = time.perf_counter()
+
+        self._stopped.set()
+        self._resumed.set()
+        self.source = None
+
+    async def disconnect(self, *, force: bool = False):
+        self.stop()
+
+
+class FakeMember:
+    def __init__(self, member_id: int):
+        self.id = member_id
+        self.name = f"member{member_id}"
+        self.mention = f"<@{member_id}>"
+        self.voice = None
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, voice_client: FakeVoiceClient | None = None):
+        self.id = guild_id
+        self.voice_client = voice_client
+        self.channels = {0: FakeChannel(0, self)}
+
+    def get_channel(self, channel_id: int) -> FakeChannel | None:
+        return self.channels.get(channel_id)
+
+    def get_member(self, member_id: int) -> FakeMember:
+        return FakeMember(member_id)
+
+
+class FakeBot:
+    """The parts of :class:`commands.Bot` the music code uses"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.user = FakeMember(0)
+        self.guilds: dict[int, FakeGuild] = {}
+
+    def get_guild(self, guild_id: int) -> FakeGuild | None:
+        return self.guilds.get(guild_id)
+
+    def add_guild(self, guild_id: int, realtime: bool = True) -> FakeGuild:
+        guild = FakeGuild(guild_id, FakeVoiceClient(realtime))
+        self.guilds[guild_id] = guild
+
+        return guild
+
+
+class FakeMessage:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.edits = 0
+
+    async def edit(self, **kwargs):
+        self.kwargs.update(kwargs)
+        self.edits += 1
+
+
+class FakeContext:
+    """
+    The parts of :class:`commands.Context` the Music cog uses, every message sent is kept in **sent**.
+    """
+
+    def __init__(self, bot: FakeBot, guild: FakeGuild, author: FakeMember):
+        self.bot = bot
+        self.guild = guild
+        self.author = author
+        self.sent: list[FakeMessage] = []
+
+    @property
+    def voice_client(self) -> FakeVoiceClient | None:
+        return self.guild.voice_client
+
+    async def send(self, content: str | None = None, **kwargs) -> FakeMessage:
+        message = FakeMessage(content=content, **kwargs)
+        self.sent.append(message)
+
+        return message
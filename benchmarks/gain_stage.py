@@ -0,0 +1,76 @@
+"""
+Compares the frames per second per core of the volume stages.
+
+Every stage reads from the same in-memory PCM source, so only the cost of the volume scaling is measured.
+
+Usage: python -m benchmarks.gain_stage [--frames 50000]
+"""
+
+import argparse
+import json
+import os
+import time
+
+import discord
+
+from utils import audio
+
+
+class StaticPCM(discord.AudioSource):
+    """Returns the same 20 ms frame of noise forever"""
+
+    def __init__(self):
+        self.frame = os.urandom(audio.FRAME_SIZE)
+
+    def read(self) -> bytes:
+        return self.frame
+
+
+def frames_per_second(source: discord.AudioSource, frames: int) -> float:
+    read = source.read
+
+    start = time.process_time()
+    for _ in range(frames):
+        read()
+
+    return frames / (time.process_time() - start)
+
+
+def ramping(source: audio.GainTransformer, frames: int) -> float:
+    # A volume change every frame, the worst case for the ramps
+    read = source.read
+
+    start = time.process_time()
+    for index in range(frames):
+        source.volume = 0.4 if index % 2 else 0.6
+        read()
+
+    return frames / (time.process_time() - start)
+
+
+def main(frames: int = 50000):
+    results = {
+        "frames": frames,
+        "numpy": audio.numpy is not None,
+        "pcm_volume_transformer": frames_per_second(discord.PCMVolumeTransformer(StaticPCM(), 0.5), frames),
+        "gain_transformer": frames_per_second(audio.GainTransformer(StaticPCM(), 0.5), frames),
+        "gain_transformer_ramping": ramping(audio.GainTransformer(StaticPCM(), 0.5), frames)
+    }
+
+    numpy = audio.numpy
+    audio.numpy = None
+    try:
+        results["gain_transformer_fallback"] = frames_per_second(audio.GainTransformer(StaticPCM(), 0.5), frames)
+        results["gain_transformer_fallback_ramping"] = ramping(audio.GainTransformer(StaticPCM(), 0.5), frames)
+    finally:
+        audio.numpy = numpy
+
+    print(json.dumps({key: round(value) if isinstance(value, float) else value for key, value in results.items()},
+                     indent=4))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compares the frames per second of the volume stages")
+    parser.add_argument("--frames", type=int, default=50000, help="the number of frames read from every stage")
+
+    main(parser.parse_args().frames)
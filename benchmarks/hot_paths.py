@@ -0,0 +1,206 @@
+"""
+Times the hot paths of the music pipeline, with no network and no Discord connection.
+
+The extractor is replaced by canned records, the stream by a WAV fixture generated at runtime and the voice
+client by a thread pulling the frames. The ffmpeg based cases are skipped when ffmpeg is not installed.
+
+Usage: python -m benchmarks.hot_paths [--songs 10000] [--realtime]
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import tempfile
+import time
+
+from benchmarks import fixtures
+from commands import music
+from utils import audio
+from utils import metadata_cache as metadata_cache_utils
+from utils import ytdl_utils
+
+
+def make_song(index: int, stream_url: str | None = None, codec: str | None = None) -> ytdl_utils.Song:
+    record = fixtures.make_record(index, stream_url, codec)
+
+    return ytdl_utils.Song(record["url"], f"https://www.youtube.com/watch?v={record['id']}", requester=None,
+                           video_id=record["id"], codec=record["acodec"], **ytdl_utils.metadata_from_info(record))
+
+
+def rounded(value):
+    if isinstance(value, dict):
+        return {key: rounded(item) for key, item in value.items()}
+
+    return round(value, 2) if isinstance(value, float) else value
+
+
+def rate(count: int, seconds: float) -> float:
+    return count / seconds if seconds else float("inf")
+
+
+def mean_microseconds(seconds: float, count: int) -> float:
+    return seconds / count * 1e6
+
+
+async def bench_queue(bot: fixtures.FakeBot, songs: int) -> dict:
+    """Appends songs to a player's queue and advances through it"""
+
+    guild = bot.add_guild(1)
+    ctx = fixtures.FakeContext(bot, guild, fixtures.FakeMember(1))
+    handler = music.music_player.PlayerHandler()
+    player = handler.create_player(ctx)
+
+    queued = [make_song(index) for index in range(songs)]
+
+    start = time.perf_counter()
+    for song in queued:
+        player.add(song)
+    append = time.perf_counter() - start
+
+    queue = player.current_queue()
+    start = time.perf_counter()
+    while queue:
+        queue.advance()
+    advance = time.perf_counter() - start
+
+    return {"append_per_second": rate(songs, append), "advance_per_second": rate(songs, advance)}
+
+
+async def bench_fetch(bot: fixtures.FakeBot, songs: int) -> dict:
+    """Fetches songs through the player, first from the extractor, then from the metadata cache"""
+
+    guild = bot.add_guild(2)
+    player = music.music_player.PlayerHandler().create_player(fixtures.FakeContext(bot, guild,
+                                                                                    fixtures.FakeMember(1)))
+    urls = [f"https://www.youtube.com/watch?v={index:011d}" for index in range(songs)]
+
+    results = {}
+    for phase in ("extractor", "cache"):
+        start = time.perf_counter()
+        for url in urls:
+            await player.fetch(url)
+        results[f"{phase}_per_second"] = rate(songs, time.perf_counter() - start)
+
+    return results
+
+
+async def bench_embeds(bot: fixtures.FakeBot, cog: music.Music, repeat: int) -> dict:
+    """Builds the !queue and !np embeds with a short and a long queue"""
+
+    results = {}
+
+    for length in (10, 1000):
+        guild = bot.add_guild(100 + length)
+        ctx = fixtures.FakeContext(bot, guild, fixtures.FakeMember(1))
+        player = music.player_handler.create_player(ctx)
+
+        for index in range(length):
+            player.add(make_song(index))
+        player.now_playing().start_time = music.datetime.now()
+
+        for name, command in (("queue", cog.queue), ("now_playing", cog.now_playing)):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                await command.callback(cog, ctx)
+            results[f"{name}_{length}_us"] = mean_microseconds(time.perf_counter() - start, repeat)
+
+        await music.player_handler.evict(guild.id)
+
+    return results
+
+
+def bench_source_construction(wav: str, repeat: int) -> dict:
+    """Builds the PCM playback chain (read-ahead ring and gain stage) over the WAV fixture"""
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        source = ytdl_utils.YTDLSource(audio.BufferedAudio(fixtures.WavPCM(wav)), song=make_song(0), volume=0.5)
+        source.cleanup()
+
+    return {"ytdl_source_us": mean_microseconds(time.perf_counter() - start, repeat)}
+
+
+async def bench_from_song(loop: asyncio.AbstractEventLoop, location: str, codec: str, repeat: int) -> dict:
+    """Creates the audio source of a song through from_song, spawning ffmpeg"""
+
+    start = time.perf_counter()
+    for index in range(repeat):
+        source = await ytdl_utils.YTDLSource.from_song(make_song(index, location, codec), loop)
+        source.cleanup()
+
+    return {f"from_song_{codec}_ms": mean_microseconds(time.perf_counter() - start, repeat) / 1000}
+
+
+def bench_frames(source, realtime: bool) -> dict:
+    """Plays a source to its end through the fake voice client"""
+
+    voice = fixtures.FakeVoiceClient(realtime)
+
+    start = time.perf_counter()
+    voice.play(source)
+    voice.wait()
+    elapsed = time.perf_counter() - start
+
+    buffered = source.original if isinstance(source, ytdl_utils.YTDLSource) else source
+
+    return {"frames": voice.frames, "frames_per_second": rate(voice.frames, elapsed),
+            "underruns": getattr(buffered, "underruns", 0)}
+
+
+async def main(songs: int = 10000, realtime: bool = False):
+    loop = asyncio.get_running_loop()
+    directory = tempfile.TemporaryDirectory()
+
+    wav = str(fixtures.write_wav(f"{directory.name}/fixture.wav", seconds=10))
+    opus = fixtures.write_opus(f"{directory.name}/fixture.ogg", wav)
+
+    # Nothing may reach the network, the real metadata cache or the loudness analysis
+    ytdl_utils.extraction_backend = fixtures.FakeExtractionBackend(wav, "pcm_s16le")
+    ytdl_utils.ffmpeg_options = ytdl_utils.local_ffmpeg_options
+    ytdl_utils.metadata_cache = metadata_cache_utils.MetadataCache(f"{directory.name}/metadata.sqlite3")
+    ytdl_utils.audio_cache = None
+    ytdl_utils.loudness_analyzer = None
+    music.player_handler.store = None
+
+    bot = fixtures.FakeBot(loop)
+    cog = music.Music(bot)
+
+    results = {
+        "python": platform.python_version(),
+        "numpy": audio.numpy is not None,
+        "ffmpeg": fixtures.has_ffmpeg(),
+        "songs": songs,
+        "queue": await bench_queue(bot, songs),
+        "fetch": await bench_fetch(bot, min(songs, 1000)),
+        "embeds": await bench_embeds(bot, cog, 200),
+        "construction": bench_source_construction(wav, 200),
+        "frames": {
+            "wav": bench_frames(ytdl_utils.YTDLSource(audio.BufferedAudio(fixtures.WavPCM(wav)), song=make_song(0),
+                                                      volume=0.5), realtime)
+        }
+    }
+
+    if fixtures.has_ffmpeg():
+        results["construction"].update(await bench_from_song(loop, wav, "pcm_s16le", 20))
+        results["construction"].update(await bench_from_song(loop, str(opus), "opus", 20))
+
+        results["frames"]["ffmpeg_pcm"] = bench_frames(
+            await ytdl_utils.YTDLSource.from_song(make_song(0, wav, "pcm_s16le"), loop), realtime)
+        results["frames"]["ffmpeg_opus"] = bench_frames(
+            await ytdl_utils.YTDLSource.from_song(make_song(1, str(opus), "opus"), loop), realtime)
+
+    await cog.resolver.close()
+    ytdl_utils.metadata_cache.close()
+    directory.cleanup()
+
+    print(json.dumps(rounded(results), indent=4))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times the hot paths of the music pipeline")
+    parser.add_argument("--songs", type=int, default=10000, help="the number of songs queued and fetched")
+    parser.add_argument("--realtime", action="store_true", help="pull the frames at real-time speed")
+    arguments = parser.parse_args()
+
+    asyncio.run(main(arguments.songs, arguments.realtime))
@@ -0,0 +1,235 @@
+"""
+Simulates many guilds using the Music cog at the same time, to find how many one process can serve.
+
+Every simulated guild has its own fake context and voice client pulling frames in real time, and fires a mix of
+!play, !skip, !queue and !np through the real Music cog commands. Searches go to a local stand-in of the
+results page and the extractor answers with canned records after a simulated delay. The streams are served
+by the same local server when ffmpeg is installed, otherwise the sources read the WAV fixture directly.
+
+The guild count is ramped up step by step. For every step the command latency percentiles, the gaps between
+tracks, the frame underruns and the event loop lag are reported as JSON.
+
+Usage: python -m benchmarks.load_simulator [--guilds 1,10,50,100] [--seconds 30]
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import tempfile
+import time
+import zlib
+
+from aiohttp import web
+
+from benchmarks import fixtures
+from commands import music
+from utils import audio
+from utils import metadata_cache as metadata_cache_utils
+from utils import ytdl_utils
+
+# Relative weights of the commands and the mean time between two commands of the same guild, in seconds
+COMMAND_MIX = {"play": 40, "queue": 25, "np": 25, "skip": 10}
+THINK_TIME = 1.0
+
+TRACK_SECONDS = 8
+SEARCH_DELAY = 0.05
+EXTRACTION_DELAY = 0.3
+
+# The simulated users pick their songs from this pool, so the search cache gets both hits and misses
+song_names = [f"artist {index % 97} song {index}" for index in range(2000)]
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"count": 0}
+
+    values = sorted(values)
+
+    def at(fraction: float) -> float:
+        return round(values[min(len(values) - 1, int(fraction * len(values)))] * 1000, 2)
+
+    return {"count": len(values), "p50_ms": at(0.5), "p90_ms": at(0.9), "p99_ms": at(0.99),
+            "max_ms": round(values[-1] * 1000, 2)}
+
+
+class StandInServer:
+    """
+    Answers the search requests like the YouTube results page, and serves the WAV fixture as the stream of
+    every video.
+    """
+
+    def __init__(self, wav: str, search_delay: float = SEARCH_DELAY):
+        self.wav = wav
+        self.search_delay = search_delay
+        self.url = ""
+
+        self._runner: web.AppRunner | None = None
+
+    async def _search(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.search_delay)
+        video_id = f"{zlib.crc32(request.query.get('search_query', '').encode()):011d}"
+
+        return web.Response(text=f'<html><a href="/watch?v={video_id}">result</a></html>', content_type="text/html")
+
+    async def _stream(self, request: web.Request) -> web.FileResponse:
+        return web.FileResponse(self.wav)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/results", self._search)
+        app.router.add_get("/stream/{video_id}", self._stream)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", 0).start()
+
+        self.url = f"http://127.0.0.1:{self._runner.addresses[0][1]}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+class LoopLagProbe:
+    """Samples the event loop lag while a step runs"""
+
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.samples: list[float] = []
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+
+async def simulate_guild(cog: music.Music, ctx: fixtures.FakeContext, deadline: float, latencies: dict,
+                         errors: dict, rng: random.Random):
+    commands = list(COMMAND_MIX)
+    weights = list(COMMAND_MIX.values())
+
+    # Every session starts with a song
+    command = "play"
+
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+
+        try:
+            if command == "play":
+                names = ", ".join(rng.choice(song_names) for _ in range(rng.choice((1, 1, 1, 3))))
+                await cog.play.callback(cog, ctx, names=names)
+            elif command == "queue":
+                await cog.queue.callback(cog, ctx)
+            elif command == "np":
+                await cog.now_playing.callback(cog, ctx)
+            else:
+                await cog.skip.callback(cog, ctx)
+        except Exception as error:
+            errors[type(error).__name__] = errors.get(type(error).__name__, 0) + 1
+        else:
+            latencies[command].append(time.perf_counter() - start)
+
+        await asyncio.sleep(rng.expovariate(1 / THINK_TIME))
+        command = rng.choices(commands, weights)[0]
+
+
+async def run_step(bot: fixtures.FakeBot, cog: music.Music, guild_count: int, seconds: float, seed: int) -> dict:
+    latencies = {command: [] for command in COMMAND_MIX}
+    errors: dict[str, int] = {}
+
+    contexts = []
+    for index in range(guild_count):
+        guild = bot.add_guild(seed * 100000 + index)
+        contexts.append(fixtures.FakeContext(bot, guild, fixtures.FakeMember(index + 1)))
+
+    probe = LoopLagProbe()
+    probe_task = asyncio.create_task(probe.run())
+
+    deadline = time.perf_counter() + seconds
+    rng = random.Random(seed)
+    await asyncio.gather(*(simulate_guild(cog, ctx, deadline, latencies, errors, random.Random(rng.random()))
+                           for ctx in contexts))
+
+    probe_task.cancel()
+
+    voices = [ctx.guild.voice_client for ctx in contexts]
+    for ctx in contexts:
+        await music.player_handler.evict(ctx.guild.id)
+        ctx.guild.voice_client.wait(1.0)
+        del bot.guilds[ctx.guild.id]
+
+    return {
+        "guilds": guild_count,
+        "seconds": seconds,
+        "commands": {command: percentiles(values) for command, values in latencies.items()},
+        "errors": errors,
+        "track_gaps": percentiles([gap for voice in voices for gap in voice.gaps]),
+        "frames": sum(voice.frames for voice in voices),
+        "underruns": sum(voice.underruns for voice in voices),
+        "event_loop_lag": percentiles(probe.samples)
+    }
+
+
+def use_wav_sources(wav: str):
+    """Plays the WAV fixture without ffmpeg, through the same read-ahead and gain stages"""
+
+    async def from_song(song: ytdl_utils.Song, loop=None, offset: float = 0.0) -> ytdl_utils.YTDLSource:
+        return ytdl_utils.YTDLSource(audio.BufferedAudio(fixtures.WavPCM(wav)), song=song,
+                                     volume=ytdl_utils.playback_volume(song))
+
+    ytdl_utils.YTDLSource.from_song = from_song
+
+
+async def main(guild_counts: list[int], seconds: float):
+    loop = asyncio.get_running_loop()
+    directory = tempfile.TemporaryDirectory()
+
+    wav = str(fixtures.write_wav(f"{directory.name}/fixture.wav", seconds=TRACK_SECONDS))
+    server = StandInServer(wav)
+    await server.start()
+
+    # Nothing may reach the network, the real metadata cache or the loudness analysis
+    if fixtures.has_ffmpeg():
+        stream_url, codec = f"{server.url}/stream/{{id}}", "pcm_s16le"
+    else:
+        stream_url, codec = wav, "pcm_s16le"
+        use_wav_sources(wav)
+
+    ytdl_utils.extraction_backend = fixtures.FakeExtractionBackend(stream_url, codec, delay=EXTRACTION_DELAY,
+                                                                   duration=TRACK_SECONDS)
+    ytdl_utils.metadata_cache = metadata_cache_utils.MetadataCache(f"{directory.name}/metadata.sqlite3")
+    ytdl_utils.audio_cache = None
+    ytdl_utils.loudness_analyzer = None
+    music.player_handler.store = None
+
+    bot = fixtures.FakeBot(loop)
+    cog = music.Music(bot)
+    cog.resolver.base_url = server.url
+
+    steps = []
+    for step, guild_count in enumerate(guild_counts, start=1):
+        steps.append(await run_step(bot, cog, guild_count, seconds, step))
+        print(f"{guild_count} guilds done", file=sys.stderr)
+
+    await cog.resolver.close()
+    await server.stop()
+    ytdl_utils.metadata_cache.close()
+    directory.cleanup()
+
+    print(json.dumps({"ffmpeg": fixtures.has_ffmpeg(), "numpy": audio.numpy is not None,
+                      "track_seconds": TRACK_SECONDS, "steps": steps}, indent=4))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ramps up simulated guilds using the Music cog")
+    parser.add_argument("--guilds", type=lambda value: [int(count) for count in value.split(",")],
+                        default=[1, 10, 50, 100], help="the guild count of every step, comma-separated")
+    parser.add_argument("--seconds", type=float, default=30.0, help="the duration of every step")
+    arguments = parser.parse_args()
+
+    asyncio.run(main(arguments.guilds, arguments.seconds))
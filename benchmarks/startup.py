@@ -0,0 +1,96 @@
+"""
+Measures the cold start of the bot, up to the point where it would log in, in fresh processes.
+
+Every run imports bot.py, loads the extensions and warms up the extraction backend, with every yt-dlp extractor
+registered or only the YouTube ones, and with the extensions loaded one after the other or concurrently.
+Nothing connects to Discord and the metrics server is not started.
+
+Usage: python -m benchmarks.startup [--runs 5]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+YOUTUBE_EXTRACTORS = ["youtube", "youtube:tab", "youtube:playlist"]
+
+CONFIGURATIONS = {
+    "all_extractors_sequential": {"extractors": "all", "loading": "sequential"},
+    "all_extractors_concurrent": {"extractors": "all", "loading": "concurrent"},
+    "trimmed_extractors_concurrent": {"extractors": "trimmed", "loading": "concurrent"}
+}
+
+
+async def measure(extractors: str, loading: str) -> dict:
+    """Runs in the child process, the timings only make sense for a process that imported nothing yet"""
+
+    started = time.perf_counter()
+
+    import settings
+
+    settings.METRICS_ENABLED = False
+    settings.SESSION_PERSISTENCE = False
+    settings.YTDL_EXTRACTORS = None if extractors == "all" else YOUTUBE_EXTRACTORS
+
+    import bot as bot_module
+    from discord.ext import commands
+
+    imported = time.perf_counter()
+
+    bot = commands.Bot(command_prefix="!", intents=bot_module.intents)
+
+    async with bot:
+        if loading == "concurrent":
+            await bot_module.setup(bot)
+        else:
+            for cmd_file in sorted(os.listdir(settings.CMDS_DIR)):
+                if cmd_file.endswith(".py"):
+                    await bot.load_extension(f"commands.{cmd_file[:-3]}")
+
+        loaded = time.perf_counter()
+
+        from utils import ytdl_utils
+
+        await ytdl_utils.extraction_backend.start()
+        warm = time.perf_counter()
+
+        ytdl_utils.extraction_backend.shutdown()
+
+    return {"import_seconds": imported - started, "setup_seconds": loaded - imported,
+            "warmup_seconds": warm - loaded, "ready_to_extract_seconds": warm - started}
+
+
+def run_child(configuration: dict) -> dict:
+    output = subprocess.run([sys.executable, "-m", "benchmarks.startup", "--child", json.dumps(configuration)],
+                            check=True, capture_output=True, text=True).stdout
+
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(runs: int):
+    results = {}
+
+    for name, configuration in CONFIGURATIONS.items():
+        samples = [run_child(configuration) for _ in range(runs)]
+        results[name] = {key: round(statistics.median(sample[key] for sample in samples) * 1000, 1)
+                         for key in samples[0]}
+        print(f"{name} done", file=sys.stderr)
+
+    print(json.dumps({"runs": runs, "median_ms": results}, indent=4))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the cold start of the bot in fresh processes")
+    parser.add_argument("--runs", type=int, default=5, help="the number of runs per configuration")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+
+    if arguments.child is not None:
+        print(json.dumps(asyncio.run(measure(**json.loads(arguments.child)))))
+    else:
+        main(arguments.runs)
@@ -0,0 +1,93 @@
+"""
+Measures the memory kept alive by every queued track.
+
+The legacy record is the Song class as it was before the compact, slotted record was introduced: it kept the
+description, the event loop reference and a per-instance __dict__.
+
+Usage: python -m benchmarks.track_memory [--count 2000]
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import tracemalloc
+
+from benchmarks import fixtures
+from utils import extraction
+from utils import ytdl_utils
+
+
+class LegacySong:
+    def __init__(self, source, url, title, description, duration_seconds, thumbnail, likes, views,
+                 duration, date, channel, channel_url, requester, loop):
+        self.source = source
+        self.url = url
+
+        self.title = title
+        self.description = description
+        self.duration = duration
+        self.duration_seconds = duration_seconds
+        self.date = date
+
+        self.likes = likes
+        self.views = views
+
+        self.thumbnail = thumbnail
+        self.channel = channel
+        self.channel_url = channel_url
+
+        self.start_time = datetime.datetime.now()
+        self.requester = requester
+        self.is_looping = loop
+
+
+def legacy_track(index, loop):
+    data = fixtures.make_info(index)
+
+    return LegacySong(data["url"], "https://www.youtube.com/watch?v=" + data["id"], data["title"],
+                      data["description"], data["duration"], data["thumbnail"], data["like_count"],
+                      data["view_count"], data["duration_string"], data["upload_date"], data["uploader"],
+                      data["uploader_url"], None, loop)
+
+
+def compact_track(index, loop):
+    data = extraction.make_record(fixtures.make_info(index))
+
+    return ytdl_utils.Song(data["url"], "https://www.youtube.com/watch?v=" + data["id"], requester=None,
+                           video_id=data["id"], **ytdl_utils.metadata_from_info(data))
+
+
+def measure(factory, count: int) -> float:
+    loop = asyncio.new_event_loop()
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracks = [factory(index, loop) for index in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    loop.close()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del tracks
+
+    return size / count
+
+
+def main(count: int = 2000):
+    legacy = measure(legacy_track, count)
+    compact = measure(compact_track, count)
+
+    print(json.dumps({
+        "tracks": count,
+        "legacy_bytes_per_track": round(legacy),
+        "compact_bytes_per_track": round(compact),
+        "ratio": round(legacy / compact, 2)
+    }, indent=4))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the memory kept alive by every queued track")
+    parser.add_argument("--count", type=int, default=2000, help="the number of tracks created")
+
+    main(parser.parse_args().count)
@@ -1,31 +1,68 @@
 import asyncio
 import os
+import time
 
 import settings
 import discord
 from discord.ext import commands
 
+from utils import metrics
+
 logger = settings.logging.getLogger("bot")
 
 intents = discord.Intents.default()
 intents.message_content = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
 
+def create_bot(shard_ids: list[int] | None = None, shard_count: int | None = None) -> commands.Bot:
+    """
+    Creates the bot, sharded if it is enabled in the settings or if it runs a range of shards.
+
+    Args:
+        shard_ids:  :class:`list[int]`: The shards run by this process, None to run all of them.
+        shard_count:    :class:`int`: The total number of shards, None to use the count recommended by Discord.
+
+    Returns:
+        commands.Bot: The bot instance, a :class:`commands.AutoShardedBot` when sharded.
+
+    """
+    if settings.SHARDED or shard_ids is not None:
+        return commands.AutoShardedBot(command_prefix="!", intents=intents, shard_ids=shard_ids,
+                                       shard_count=shard_count or settings.SHARD_COUNT)
+
+    return commands.Bot(command_prefix="!", intents=intents)
+
+
+async def setup(bot: commands.Bot):
+    """Load commands (cog files) from the command file, concurrently"""
 
-async def setup():
-    """Load commands (cog files) from the command file"""
+    started = time.perf_counter()
 
-    for cmd_file in os.listdir(settings.CMDS_DIR):
-        if cmd_file.endswith(".py"):
-            await bot.load_extension(f"commands.{cmd_file[:-3]}")
+    await asyncio.gather(*(bot.load_extension(f"commands.{cmd_file[:-3]}")
+                           for cmd_file in sorted(os.listdir(settings.CMDS_DIR)) if cmd_file.endswith(".py")))
+
+    logger.info(f"Extensions loaded in {time.perf_counter() - started:.2f}s")
+
+
+async def log_time_to_ready(bot: commands.Bot, started: float):
+    """Logs the time between **started** (a perf_counter value) and the first ready event of the bot"""
+
+    await bot.wait_until_ready()
+
+    elapsed = time.perf_counter() - started
+    metrics.startup_seconds.set(elapsed)
+    logger.info(f"Ready in {elapsed:.2f}s with {len(bot.guilds)} guilds")
 
 
 async def main():
     """The main function for setting up and running the bot"""
 
+    started = time.perf_counter()
+    bot = create_bot()
+
     async with bot:
-        await setup()
+        await setup(bot)
+        bot.loop.create_task(log_time_to_ready(bot, started))
         await bot.start(settings.BOT_SECRET)
 
 
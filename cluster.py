@@ -0,0 +1,384 @@
+import asyncio
+import copy
+import math
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import time
+
+import discord
+
+import settings
+from utils import logging_utils
+
+logger = settings.logging.getLogger("bot")
+
+
+def shard_ranges(shard_count: int, cluster_count: int) -> list[list[int]]:
+    """
+    Splits the shards into contiguous ranges of (almost) the same size, one per cluster.
+
+    Args:
+        shard_count:    :class:`int`: The total number of shards.
+        cluster_count:  :class:`int`: The number of clusters, capped to the number of shards.
+
+    Returns:
+        list[list[int]]: The shard ids run by every cluster.
+
+    """
+    cluster_count = max(1, min(cluster_count, shard_count))
+    size, extra = divmod(shard_count, cluster_count)
+
+    ranges = []
+    start = 0
+    for index in range(cluster_count):
+        end = start + size + (index < extra)
+        ranges.append(list(range(start, end)))
+        start = end
+
+    return ranges
+
+
+async def recommended_shard_count(token: str) -> int:
+    """Asks Discord for the number of shards the bot should run"""
+
+    client = discord.Client(intents=discord.Intents.none())
+
+    async with client:
+        await client.login(token)
+        shards, _, _ = await client.http.get_bot_gateway()
+
+    return shards
+
+
+def health_report(bot: discord.Client) -> dict:
+    """
+    Builds the health report a cluster sends to the launcher.
+
+    Returns:
+        dict: The readiness, the guild, voice client and player counts, and the latency of every shard in seconds.
+
+    """
+    music = sys.modules.get("commands.music")
+
+    return {
+        "ready": bot.is_ready(),
+        "guilds": len(bot.guilds),
+        "voice_clients": len(bot.voice_clients),
+        "players": music.player_handler.live if music is not None else 0,
+        "latencies": {shard_id: latency for shard_id, latency in bot.latencies if math.isfinite(latency)}
+    }
+
+
+def _configure_cluster_logging(cluster_id: int):
+    # settings does not configure the logging of child processes, every cluster writes to its own file
+    config = copy.deepcopy(settings.LOGGING_CONFIG)
+
+    for formatter in config["formatters"].values():
+        if "format" in formatter:
+            formatter["format"] = f"[cluster {cluster_id}] {formatter['format']}"
+    config["handlers"]["file"]["filename"] = f"logs/cluster-{cluster_id}.log"
+
+    logging_utils.configure(config, queued=settings.LOG_QUEUED)
+
+
+async def _report_health(bot: discord.Client, cluster_id: int, reports: multiprocessing.Queue):
+    while not bot.is_ready():
+        await asyncio.sleep(1)
+
+    reports.put((cluster_id, os.getpid(), "ready", health_report(bot)))
+
+    while not bot.is_closed():
+        await asyncio.sleep(settings.CLUSTER_HEALTH_INTERVAL)
+        reports.put((cluster_id, os.getpid(), "health", health_report(bot)))
+
+
+async def _run_cluster(cluster_id: int, shard_ids: list[int], shard_count: int, reports: multiprocessing.Queue):
+    import bot as bot_module
+
+    started = time.perf_counter()
+    bot = bot_module.create_bot(shard_ids, shard_count)
+    loop = asyncio.get_running_loop()
+
+    try:
+        # The launcher stops a cluster with SIGTERM, the bot then leaves its voice channels and closes the gateway
+        loop.add_signal_handler(signal.SIGTERM, lambda: loop.create_task(bot.close()))
+    except NotImplementedError:
+        pass
+
+    async with bot:
+        await bot_module.setup(bot)
+        loop.create_task(bot_module.log_time_to_ready(bot, started))
+        reporter = loop.create_task(_report_health(bot, cluster_id, reports))
+
+        try:
+            await bot.start(settings.BOT_SECRET)
+        finally:
+            reporter.cancel()
+
+
+def run_cluster(cluster_id: int, shard_ids: list[int], shard_count: int, reports: multiprocessing.Queue):
+    """The entry point of a cluster process"""
+
+    # Ctrl+C reaches every process of the group, only the launcher decides when the clusters stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _configure_cluster_logging(cluster_id)
+    # Every cluster serves its own metrics
+    settings.METRICS_PORT += cluster_id
+
+    logger.info(f"Starting shards {shard_ids[0]}-{shard_ids[-1]} of {shard_count}")
+    asyncio.run(_run_cluster(cluster_id, shard_ids, shard_count, reports))
+
+
+class Cluster:
+    """
+    A process running a range of shards, as seen by the launcher.
+
+    Attributes:
+        id: :class:`int`: The index of the cluster.
+
+        shard_ids:  :class:`list[int]`: The shards run by the cluster.
+
+        process:    :class:`multiprocessing.Process`: The current process of the cluster, None when it is stopped.
+
+        ready:  :class:`bool`: Whether all the shards of the current process are connected.
+
+        report: :class:`dict`: The last health report (see **health_report**).
+
+        restarts:   :class:`int`: The number of times the cluster was restarted.
+
+    """
+
+    def __init__(self, cluster_id: int, shard_ids: list[int]):
+        self.id = cluster_id
+        self.shard_ids = shard_ids
+        self.process: multiprocessing.Process | None = None
+
+        self.ready = False
+        self.report: dict = {}
+        self.restarts = 0
+
+        self.started = 0.0
+        self.last_seen = 0.0
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def describe(self) -> str:
+        state = "ready" if self.ready else "starting" if self.is_alive() else "down"
+        latencies = self.report.get("latencies", {})
+        latency = f"{max(latencies.values()) * 1000:.0f} ms" if latencies else "-"
+
+        return (f"cluster {self.id} (shards {self.shard_ids[0]}-{self.shard_ids[-1]}): {state}, "
+                f"{self.report.get('guilds', 0)} guilds, {self.report.get('players', 0)} players, "
+                f"latency {latency}, {self.restarts} restarts")
+
+
+class ClusterLauncher:
+    """
+    Spreads the shards of the bot across several processes and keeps them running.
+
+    The clusters are started one after the other, each one waiting for the previous one to be ready, so the
+    shards do not all identify at the same time. Every cluster reports its health periodically, the ones that
+    exit or stay silent are restarted. A rolling restart (SIGHUP) replaces the clusters one at a time.
+
+    Attributes:
+        shard_count:    :class:`int`: The total number of shards.
+
+        clusters:   :class:`list[Cluster]`: The clusters, one per range of shards.
+
+    """
+
+    def __init__(self, cluster_count: int, shard_count: int,
+                 health_timeout: float = settings.CLUSTER_HEALTH_TIMEOUT,
+                 ready_timeout: float = settings.CLUSTER_READY_TIMEOUT,
+                 restart_delay: float = settings.CLUSTER_RESTART_DELAY,
+                 stop_timeout: float = 30.0):
+        self.shard_count = shard_count
+        self.health_timeout = health_timeout
+        self.ready_timeout = ready_timeout
+        self.restart_delay = restart_delay
+        self.stop_timeout = stop_timeout
+
+        self._context = multiprocessing.get_context("spawn")
+        self._reports = self._context.Queue()
+
+        self.clusters = [Cluster(cluster_id, shard_ids)
+                         for cluster_id, shard_ids in enumerate(shard_ranges(shard_count, cluster_count))]
+
+        self._stopping = False
+        self._restart_requested = False
+
+    def _spawn(self, cluster: Cluster):
+        cluster.process = self._context.Process(target=run_cluster, name=f"cluster-{cluster.id}",
+                                                args=(cluster.id, cluster.shard_ids, self.shard_count,
+                                                      self._reports))
+        cluster.process.start()
+
+        cluster.ready = False
+        cluster.report = {}
+        cluster.started = cluster.last_seen = time.monotonic()
+
+    def _terminate(self, cluster: Cluster):
+        process = cluster.process
+        if process is None:
+            return
+
+        if process.is_alive():
+            process.terminate()
+            process.join(self.stop_timeout)
+
+            if process.is_alive():
+                logger.warning(f"Cluster {cluster.id} did not stop in time, killing it")
+                process.kill()
+                process.join()
+
+        cluster.process = None
+        cluster.ready = False
+
+    def _restart(self, cluster: Cluster, reason: str):
+        logger.warning(f"Restarting cluster {cluster.id}: {reason}")
+
+        self._terminate(cluster)
+        time.sleep(self.restart_delay)
+        self._spawn(cluster)
+        cluster.restarts += 1
+
+    def _receive(self, timeout: float):
+        """Handles the reports sent by the clusters, waiting at most **timeout** seconds for the first one"""
+
+        try:
+            message = self._reports.get(timeout=timeout)
+            while True:
+                self._handle(*message)
+                message = self._reports.get_nowait()
+        except queue.Empty:
+            pass
+
+    def _handle(self, cluster_id: int, pid: int, kind: str, report: dict):
+        cluster = self.clusters[cluster_id]
+
+        # Reports sent by a process that was replaced since then
+        if cluster.process is None or cluster.process.pid != pid:
+            return
+
+        cluster.report = report
+        cluster.last_seen = time.monotonic()
+
+        if kind == "ready":
+            cluster.ready = True
+            logger.info(f"Cluster {cluster.id} is ready with {report['guilds']} guilds")
+
+    def _wait_ready(self, cluster: Cluster) -> bool:
+        deadline = time.monotonic() + self.ready_timeout
+
+        while not cluster.ready and not self._stopping and time.monotonic() < deadline:
+            if not cluster.is_alive():
+                return False
+            self._receive(1.0)
+
+        return cluster.ready
+
+    def _check(self, cluster: Cluster):
+        now = time.monotonic()
+
+        if not cluster.is_alive():
+            exitcode = cluster.process.exitcode if cluster.process is not None else None
+            self._restart(cluster, f"the process exited with code {exitcode}")
+        elif cluster.ready and now - cluster.last_seen > self.health_timeout:
+            self._restart(cluster, f"no health report for {now - cluster.last_seen:.0f} seconds")
+        elif not cluster.ready and now - cluster.started > self.ready_timeout:
+            self._restart(cluster, f"not ready after {self.ready_timeout:.0f} seconds")
+
+    def start(self):
+        """Starts the clusters one after the other"""
+
+        for cluster in self.clusters:
+            if self._stopping:
+                return
+
+            self._spawn(cluster)
+            if not self._wait_ready(cluster):
+                logger.warning(f"Cluster {cluster.id} is not ready, starting the next one anyway")
+
+    def rolling_restart(self):
+        """
+        Replaces the clusters one at a time, waiting for every new process to be ready before the next one.
+
+        The restart is aborted if a new process does not become ready, the remaining clusters keep running.
+        """
+        logger.info("Rolling restart of the clusters")
+
+        for cluster in self.clusters:
+            if self._stopping:
+                return
+
+            self._terminate(cluster)
+            self._spawn(cluster)
+            cluster.restarts += 1
+
+            if not self._wait_ready(cluster):
+                logger.error(f"Cluster {cluster.id} is not ready after the restart, aborting the rolling restart")
+                return
+
+    def stop(self):
+        """Stops all the clusters, in parallel"""
+
+        self._stopping = True
+
+        for cluster in self.clusters:
+            if cluster.is_alive():
+                cluster.process.terminate()
+
+        for cluster in self.clusters:
+            self._terminate(cluster)
+
+    def _request_stop(self, *_):
+        self._stopping = True
+
+    def _request_restart(self, *_):
+        self._restart_requested = True
+
+    def run(self):
+        """Starts the clusters and supervises them until SIGINT or SIGTERM is received"""
+
+        signal.signal(signal.SIGINT, self._request_stop)
+        signal.signal(signal.SIGTERM, self._request_stop)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self._request_restart)
+
+        logger.info(f"Running {self.shard_count} shards in {len(self.clusters)} clusters")
+
+        try:
+            self.start()
+            next_summary = time.monotonic() + settings.CLUSTER_HEALTH_INTERVAL
+
+            while not self._stopping:
+                self._receive(1.0)
+
+                if self._restart_requested:
+                    self._restart_requested = False
+                    self.rolling_restart()
+
+                for cluster in self.clusters:
+                    if not self._stopping:
+                        self._check(cluster)
+
+                if time.monotonic() >= next_summary:
+                    next_summary += settings.CLUSTER_HEALTH_INTERVAL
+                    for cluster in self.clusters:
+                        logger.info(cluster.describe())
+        finally:
+            self.stop()
+
+
+def main():
+    shard_count = settings.SHARD_COUNT or asyncio.run(recommended_shard_count(settings.BOT_SECRET))
+
+    ClusterLauncher(settings.CLUSTER_COUNT, shard_count).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -9,27 +9,26 @@ class DeveloperUtils(commands.Cog):
     @commands.command(help="Loads an extension")
     @commands.has_permissions(administrator=True)
     async def load(self, ctx: commands.Context, extension: str):
-        if ctx.voice_client is not None:
-            await ctx.voice_client.disconnect()
-
         await self.bot.load_extension(f"commands.{extension}")
         await ctx.send(f"Loaded extension {extension}")
 
     @commands.command(help="Unloads an extension")
     @commands.has_permissions(administrator=True)
     async def unload(self, ctx: commands.Context, extension: str):
-        if ctx.voice_client is not None:
-            await ctx.voice_client.disconnect()
-
         await self.bot.unload_extension(f"commands.{extension}")
+
+        # Without the Music cog nothing plays, every guild leaves voice. The sessions were saved by the cog,
+        # they are resumed when it is loaded again
+        if self.bot.get_cog("Music") is None:
+            for voice_client in list(self.bot.voice_clients):
+                await voice_client.disconnect()
+
         await ctx.send(f"Unloaded extension {extension}")
 
     @commands.command(help="Reloads an extension")
     @commands.has_permissions(administrator=True)
     async def reload(self, ctx: commands.Context, extension: str):
-        if ctx.voice_client is not None:
-            await ctx.voice_client.disconnect()
-
+        # With the sessions persisted, the voice connections are kept and the reloaded cog resumes the music
         await self.bot.unload_extension(f"commands.{extension}")
         await self.bot.load_extension(f"commands.{extension}")
         await ctx.send(f"Reloaded extension {extension}")
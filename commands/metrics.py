@@ -0,0 +1,50 @@
+import settings
+
+from discord.ext import commands
+
+from utils import metrics
+
+logger = settings.logging.getLogger("bot")
+
+
+class Metrics(commands.Cog):
+    """
+    A cog serving the bot's metrics to Prometheus, on a local HTTP endpoint.
+
+    It also measures the event loop lag for as long as it is loaded.
+
+    Attributes:
+        bot:    :class:`commands.Bot`: The bot instance associated with this cog.
+
+        server: :class:`metrics.MetricsServer`: The HTTP server exposing **metrics.registry**.
+
+    """
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.server = metrics.MetricsServer(metrics.registry, settings.METRICS_HOST, settings.METRICS_PORT)
+
+        self._lag_monitor = None
+
+    async def cog_load(self):
+        """Starts the HTTP server and the event loop lag monitor"""
+
+        self._lag_monitor = self.bot.loop.create_task(metrics.monitor_event_loop(settings.METRICS_LOOP_LAG_INTERVAL))
+
+        try:
+            await self.server.start()
+        except OSError as error:
+            logger.warning(f"Could not serve the metrics on {settings.METRICS_HOST}:{settings.METRICS_PORT}: {error}")
+
+    async def cog_unload(self):
+        """Stops the HTTP server and the event loop lag monitor"""
+
+        if self._lag_monitor is not None:
+            self._lag_monitor.cancel()
+
+        await self.server.stop()
+
+
+async def setup(bot):
+    if settings.METRICS_ENABLED:
+        await bot.add_cog(Metrics(bot))
@@ -1,14 +1,24 @@
+import asyncio
 import math
+import time
 from datetime import datetime
 
 import discord
 from discord.ext import commands
+from discord.ext import tasks
 
+import settings
+from utils import metrics
 from utils import music_utils
 from utils import music_player
+from utils import queue_view
+from utils import session_store as session_store_utils
 from utils import ytdl_utils
 
-player_handler = music_player.PlayerHandler()
+logger = settings.logging.getLogger("bot")
+
+player_handler = music_player.PlayerHandler(
+    store=session_store_utils.SessionStore(settings.SESSIONS_DB) if settings.SESSION_PERSISTENCE else None)
 
 
 class Music(commands.Cog):
@@ -21,7 +31,9 @@ class Music(commands.Cog):
     Attributes:
         bot:    :class:`commands.Bot`: The bot instance associated with this cog.
 
-        find_url:   :class:`function` --> A function to find a valid URL from a song name.
+        resolver:   :class:`music_utils.SearchResolver`: The pooled resolver used to search for songs.
+
+        find_url:   :class:`function` --> A coroutine to find a valid URL from a song name.
 
     """
 
@@ -34,7 +46,151 @@ class Music(commands.Cog):
 
         """
         self.bot = bot
-        self.find_url = music_utils.find_url
+        self.resolver = music_utils.SearchResolver(timeout=settings.SEARCH_TIMEOUT,
+                                                   concurrency=settings.SEARCH_CONCURRENCY,
+                                                   cache=music_utils.QueryCache(settings.SEARCH_CACHE_SIZE,
+                                                                                settings.SEARCH_CACHE_TTL))
+        self.find_url = self.resolver.find_url
+
+        self._restoring: dict[int, asyncio.Task] = {}
+        # The guilds whose saved session was already looked up, whether there was one or not
+        self._restored: set[int] = set()
+        self._warmup: asyncio.Task | None = None
+
+    async def cog_load(self):
+        """
+        Starts warming up the extraction backend and starts the idle player sweep when the cog is loaded.
+
+        The warm-up runs in the background so it does not delay the login, the extractions requested before it
+        ends wait for it. When the cog is reloaded on a running bot, the saved sessions are resumed right away.
+        """
+
+        self._warmup = self.bot.loop.create_task(self.warm_up())
+        self.sweep_players.start()
+
+        if player_handler.store is not None:
+            self.checkpoint_sessions.start()
+
+            if self.bot.is_ready():
+                self.bot.loop.create_task(self.restore_sessions())
+
+    async def cog_unload(self):
+        """
+        Stops the background tasks and closes the resolver's HTTP session when the cog is unloaded.
+
+        The players are always stopped, the next instance of the cog starts with a handler of its own. With
+        the sessions persisted, they are stopped without leaving the voice channels or forgetting their sessions,
+        so the next instance picks them up where they stopped. Otherwise nothing could resume them, they are
+        evicted and leave voice.
+        """
+
+        self.sweep_players.cancel()
+        if self._warmup is not None:
+            self._warmup.cancel()
+        await self.resolver.close()
+
+        if player_handler.store is None:
+            for guild_id in list(player_handler.players):
+                await player_handler.evict(guild_id)
+            return
+
+        self.checkpoint_sessions.cancel()
+
+        for task in self._restoring.values():
+            task.cancel()
+
+        player_handler.suspend()
+        # Waits for the pending writes, the next instance of the cog reads them
+        await self.bot.loop.run_in_executor(None, player_handler.store.close)
+
+    async def warm_up(self):
+        """Builds the YoutubeDL instances (or spawns the worker processes) of the extraction backend"""
+
+        started = time.perf_counter()
+
+        try:
+            await ytdl_utils.extraction_backend.start()
+        except Exception as error:
+            logger.warning(f"Could not warm up the extraction backend: {error}")
+        else:
+            logger.info(f"Extraction backend ready in {time.perf_counter() - started:.2f}s")
+
+    async def cog_before_invoke(self, ctx: discord.ext.commands.Context):
+        """Restores the saved session of the guild before its first music command"""
+
+        if player_handler.store is not None and ctx.guild is not None:
+            await self.restore_guild(ctx.guild)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        """Resumes the saved sessions once the guilds are available"""
+
+        if player_handler.store is not None:
+            await self.restore_sessions()
+
+    async def restore_guild(self, guild: discord.Guild):
+        """
+        Restores the saved session of a guild once, concurrent callers wait for the same restoration.
+
+        The store is only asked once per guild: a session is only saved while the guild has a player, so there
+        is nothing new to restore afterwards.
+        """
+
+        if guild.id in player_handler.players or guild.id in self._restored:
+            return
+
+        task = self._restoring.get(guild.id)
+        if task is None:
+            task = self._restoring[guild.id] = self.bot.loop.create_task(
+                player_handler.restore(self.bot, guild, ffmpeg_options=ytdl_utils.ffmpeg_options))
+
+            def done(_):
+                self._restoring.pop(guild.id, None)
+                self._restored.add(guild.id)
+
+            task.add_done_callback(done)
+
+        try:
+            await asyncio.shield(task)
+        except Exception as error:
+            logger.warning(f"Could not restore the session of {guild.id}: {error}")
+
+    async def restore_sessions(self):
+        """
+        Resumes the saved sessions of the guilds served by this bot, one guild at a time.
+
+        The sessions of the guilds served by other clusters are left to them, and a guild that runs a command
+        in the meantime is restored first by **cog_before_invoke**.
+        """
+
+        for guild_id in await player_handler.store.run(player_handler.store.guild_ids):
+            guild = self.bot.get_guild(guild_id)
+
+            if guild is not None:
+                await self.restore_guild(guild)
+
+    @tasks.loop(seconds=settings.SESSION_CHECKPOINT_INTERVAL)
+    async def checkpoint_sessions(self):
+        """Saves the position in the playing songs"""
+
+        player_handler.checkpoint()
+
+    @tasks.loop(seconds=settings.PLAYER_SWEEP_INTERVAL)
+    async def sweep_players(self):
+        """Disconnects the players that stayed idle for too long"""
+
+        try:
+            await player_handler.sweep()
+        except Exception as error:
+            logger.warning(f"The idle player sweep failed: {error}")
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState,
+                                    after: discord.VoiceState):
+        """Forgets the player of a guild as soon as the bot leaves its voice channel"""
+
+        if member.id == self.bot.user.id and before.channel is not None and after.channel is None:
+            await player_handler.evict(member.guild.id, disconnect=False)
 
     @commands.command(aliases=["p"], help="Queues and plays a song")
     async def play(self, ctx: discord.ext.commands.Context, *, names):
@@ -47,19 +203,243 @@ class Music(commands.Cog):
 
         """
 
+        started = time.perf_counter()
+        embed_message = discord.Embed()
+
+        player = player_handler.get_player(ctx)
+        if player is None:
+            player = player_handler.create_player(ctx, ffmpeg_options=ytdl_utils.ffmpeg_options)
+
+        if music_utils.is_playlist(names):
+            await self.play_playlist(ctx, player, names.strip())
+            return
+
+        if len(names.split(",")) > 1:
+            await self.play_batch(ctx, player, names.split(","), started)
+            return
+
+        try:
+            song = await self.resolve_song(player, names, ctx.author)
+        except Exception as error:
+            error_message = discord.Embed()
+            error_message.set_author(name="Song Not Found")
+
+            error_message.add_field(name=f":x: Could not queue **{names.strip()}**",
+                                    value=f"{error}", inline=False)
+
+            error_message.colour = discord.Colour.dark_red()
+            await ctx.send(embed=error_message)
+            return
+
+        player.add(song)
+
+        if player.is_idle():
+            song, skipped = await player.play()
+
+            if song is None:
+                embed_message.set_author(name="Playback Failed")
+                self.add_playback_errors(embed_message, skipped)
+
+                embed_message.colour = discord.Colour.dark_red()
+                await ctx.send(embed=embed_message)
+                return
+
+            embed_message.set_author(name=f"Let the Music Play!")
+            embed_message.set_thumbnail(url=song.thumbnail)
+
+            embed_message.add_field(name=f"🎵 Now spinning:",
+                                    value=f"[{song.title}]({song.url})")
+            embed_message.add_field(name=":microphone: By:",
+                                    value=f"[{song.channel}]({song.channel_url})", inline=True)
+            embed_message.add_field(name=f":timer: Duration: {song.duration}",
+                                    value=f"", inline=False)
+
+            embed_message.add_field(name=":mega: Get ready to groove! The music is back and better than ever.",
+                                    value="", inline=False)
+
+            if skipped:
+                self.add_playback_errors(embed_message, skipped)
+
+            embed_message.colour = discord.Colour.dark_blue()
+            await ctx.send(embed=embed_message)
+            metrics.play_seconds.observe(time.perf_counter() - started)
+        else:
+            embed_message.set_author(name=f'Song added to queue!')
+            embed_message.set_thumbnail(url=song.thumbnail)
+
+            embed_message.add_field(name=f"🎵 Latest addition:",
+                                    value=f"[{song.title}]({song.url})", inline=True)
+            embed_message.add_field(name=":microphone: By:",
+                                    value=f"[{song.channel}]({song.channel_url})", inline=True)
+            embed_message.add_field(name=f":timer: Duration: {song.duration}",
+                                    value=f"", inline=False)
+            embed_message.add_field(name=f":card_index: Position in"
+                                         f"queue: {len(player.current_queue()) - 1}",
+                                    value=f"", inline=True)
+
+            embed_message.add_field(name=f":loud_sound: Exciting choices ahead! Feel free to explore the queue or "
+                                         f"use playback commands to enjoy the music.",
+                                    value="", inline=False)
+
+            embed_message.colour = discord.Colour.dark_blue()
+            await ctx.send(embed=embed_message)
+
+    async def resolve_song(self, player: music_player.MusicPlayer, name: str,
+                           requester: discord.Member) -> ytdl_utils.Song:
+        """Finds the video of a song name, keywords or url and fetches its song"""
+
+        return await player.fetch(await self.find_url(name), requester=requester)
+
+    @staticmethod
+    def add_playback_errors(embed_message: discord.Embed, skipped: list[tuple[ytdl_utils.Song, Exception]]):
+        """Lists the songs dropped from the queue because they could not be played"""
+
+        errors = [f"**{queue_view.shorten_title(song.title)}**: {str(error)[:100]}" for song, error in skipped[:5]]
+        if len(skipped) > 5:
+            errors.append(f"...and {len(skipped) - 5} more")
+
+        embed_message.add_field(name=f":x: Could not play {len(skipped)} of the songs",
+                                value="\n".join(errors), inline=False)
+
+    async def play_batch(self, ctx: discord.ext.commands.Context, player: music_player.MusicPlayer,
+                         names: list[str], started: float):
+        """
+        Queues several songs and reports them in a single message.
+
+        The songs are resolved concurrently and queued in order. The reply is sent right away and edited as the
+        songs are queued, at most every **PLAY_PROGRESS_INTERVAL** seconds, except for the song that starts the
+        playback which is announced immediately. The last edit turns it into the summary of the batch.
+
+        Args:
+            ctx:    :class:`discord.ext.commands.Context`: The context of the command invocation.
+            player: :class:`music_player.MusicPlayer`: The player of the guild.
+            names:  :class:`list[str]`: The song names, keywords or urls.
+            started:    :class:`float`: The time the command was received, from **time.perf_counter**.
+
+        """
+
+        progress = music_utils.ProgressMessage(ctx, settings.PLAY_PROGRESS_INTERVAL)
+        playing: ytdl_utils.Song | None = None
+        queued: list[tuple[int, ytdl_utils.Song]] = []
+        failed: list[tuple[str, Exception]] = []
+
+        await progress.update(self.batch_embed(len(names), playing, queued, failed))
+
+        async for name, song, error in music_utils.resolve_in_order(
+                names, lambda name: self.resolve_song(player, name, ctx.author), settings.PLAY_BATCH_CONCURRENCY):
+            if error is not None:
+                failed.append((name.strip(), error))
+            else:
+                player.add(song)
+
+                if player.is_idle():
+                    started_song, skipped = await player.play()
+                    failed.extend((skipped_song.title, error) for skipped_song, error in skipped)
+
+                    if started_song is not None:
+                        playing = started_song
+
+                        await progress.update(self.batch_embed(len(names), playing, queued, failed), now=True)
+                        metrics.play_seconds.observe(time.perf_counter() - started)
+                        continue
+                else:
+                    queued.append((len(player.current_queue()) - 1, song))
+
+            await progress.update(self.batch_embed(len(names), playing, queued, failed))
+
+        await progress.finish(self.batch_embed(len(names), playing, queued, failed, done=True))
+
+    @staticmethod
+    def batch_embed(total: int, playing: ytdl_utils.Song | None, queued: list[tuple[int, ytdl_utils.Song]],
+                    failed: list[tuple[str, Exception]], done: bool = False) -> discord.Embed:
+        """
+        Renders the progress, or the summary once **done**, of a !play with several songs.
+
+        Args:
+            total:  :class:`int`: The number of songs requested.
+            playing:    :class:`ytdl_utils.Song`: The song the batch started playing, if any.
+            queued: :class:`list[tuple[int, ytdl_utils.Song]]`: The songs added to the queue, with their position.
+            failed: :class:`list[tuple[str, Exception]]`: The names that could not be queued, with the error.
+            done:   :class:`bool`: Whether every song was handled.
+
+        Returns:
+            discord.Embed: The embed of the reply.
+
+        """
+
         embed_message = discord.Embed()
 
-        for name in names.split(","):
-            url = self.find_url(name)
+        if not done:
+            embed_message.set_author(name=f"Queueing {total} songs...")
+        elif playing is None and not queued:
+            embed_message.set_author(name="Songs Not Found")
+        else:
+            embed_message.set_author(name="Songs added to queue!")
+
+        if playing is not None:
+            embed_message.set_thumbnail(url=playing.thumbnail)
+
+            embed_message.add_field(name=f"🎵 Now spinning:",
+                                    value=f"[{playing.title}]({playing.url})")
+            embed_message.add_field(name=":microphone: By:",
+                                    value=f"[{playing.channel}]({playing.channel_url})", inline=True)
+            embed_message.add_field(name=f":timer: Duration: {playing.duration}",
+                                    value=f"", inline=False)
+
+        lines = [f"**{position}**. [{queue_view.shorten_title(song.title)}]({song.url})"
+                 for position, song in queued[:settings.QUEUE_PAGE_SIZE]]
+        if len(queued) > settings.QUEUE_PAGE_SIZE:
+            lines.append(f"...and {len(queued) - settings.QUEUE_PAGE_SIZE} more")
+        embed_message.description = "\n".join(lines)
+
+        if failed:
+            errors = [f"**{name[:50]}**: {str(error)[:100]}" for name, error in failed[:5]]
+            if len(failed) > 5:
+                errors.append(f"...and {len(failed) - 5} more")
+
+            embed_message.add_field(name=f":x: Could not queue {len(failed)} of the songs",
+                                    value="\n".join(errors), inline=False)
+
+        handled = len(queued) + len(failed) + (playing is not None)
+        if done:
+            embed_message.add_field(name=f":card_index: {len(queued) + (playing is not None)} of {total} songs "
+                                         f"were queued. Use the queue command to see what's lined up.",
+                                    value="", inline=False)
+        else:
+            embed_message.add_field(name=f":hourglass: {handled}/{total} songs handled", value="", inline=False)
+
+        embed_message.colour = discord.Colour.dark_red() if done and playing is None and not queued \
+            else discord.Colour.dark_blue()
+
+        return embed_message
+
+    async def play_playlist(self, ctx: discord.ext.commands.Context, player: music_player.MusicPlayer, url: str):
+        """
+        Streams the entries of a playlist into the queue and starts playing as soon as the first one is ready.
+
+        Args:
+            ctx:    :class:`discord.ext.commands.Context`: The context of the command invocation.
+            player: :class:`music_player.MusicPlayer`: The player of the guild.
+            url:    :class:`str`: The URL of the playlist.
+
+        """
 
-            player = player_handler.get_player(ctx)
-            if player is None:
-                player = player_handler.create_player(ctx, ffmpeg_options=ytdl_utils.ffmpeg_options)
+        count = 0
+        skipped: list[tuple[ytdl_utils.Song, Exception]] = []
 
-            if not ctx.voice_client.is_playing():
-                await player.queue(url)
-                song = await player.play()
+        async for song in ytdl_utils.iter_playlist(url, self.bot.loop, requester=ctx.author,
+                                                   page_size=settings.PLAYLIST_PAGE_SIZE):
+            player.add(song)
+            count += 1
 
+            # The entries that cannot be played are dropped, the next entry is started in their place
+            if player.is_idle():
+                song, failed = await player.play()
+                skipped.extend(failed)
+                if song is None:
+                    continue
+
+                embed_message = discord.Embed()
                 embed_message.set_author(name=f"Let the Music Play!")
                 embed_message.set_thumbnail(url=song.thumbnail)
 
@@ -70,32 +450,32 @@ class Music(commands.Cog):
                 embed_message.add_field(name=f":timer: Duration: {song.duration}",
                                         value=f"", inline=False)
 
-                embed_message.add_field(name=":mega: Get ready to groove! The music is back and better than ever.",
-                                        value="", inline=False)
-
                 embed_message.colour = discord.Colour.dark_blue()
                 await ctx.send(embed=embed_message)
-            else:
-                song = await player.queue(url)
-                embed_message.set_author(name=f'Song added to queue!')
-                embed_message.set_thumbnail(url=song.thumbnail)
 
-                embed_message.add_field(name=f"🎵 Latest addition:",
-                                        value=f"[{song.title}]({song.url})", inline=True)
-                embed_message.add_field(name=":microphone: By:",
-                                        value=f"[{song.channel}]({song.channel_url})", inline=True)
-                embed_message.add_field(name=f":timer: Duration: {song.duration}",
-                                        value=f"", inline=False)
-                embed_message.add_field(name=f":card_index: Position in"
-                                             f"queue: {len(player.handler.queue[ctx.guild]) - 1}",
-                                        value=f"", inline=True)
+        embed_message = discord.Embed()
 
-                embed_message.add_field(name=f":loud_sound: Exciting choices ahead! Feel free to explore the queue or "
-                                             f"use playback commands to enjoy the music.",
-                                        value="", inline=False)
+        if count == 0:
+            embed_message.set_author(name="Empty Playlist")
 
-                embed_message.colour = discord.Colour.dark_blue()
-                await ctx.send(embed=embed_message)
+            embed_message.add_field(name=":x: No songs could be found in this playlist.",
+                                    value="", inline=False)
+
+            embed_message.colour = discord.Colour.dark_red()
+        else:
+            embed_message.set_author(name="Playlist added to queue!")
+
+            embed_message.add_field(name=f":card_index: {count - len(skipped)} songs were added to the queue.",
+                                    value="", inline=False)
+            if skipped:
+                self.add_playback_errors(embed_message, skipped)
+            embed_message.add_field(name=f":loud_sound: Exciting choices ahead! Feel free to explore the queue or "
+                                         f"use playback commands to enjoy the music.",
+                                    value="", inline=False)
+
+            embed_message.colour = discord.Colour.dark_blue()
+
+        await ctx.send(embed=embed_message)
 
     @commands.command(help="Stops the playlist and clears the queue")
     async def stop(self, ctx: discord.ext.commands.Context):
@@ -185,7 +565,7 @@ class Music(commands.Cog):
 
             embed_message.set_author(name="Music Playback Resumed!")
 
-            song = player.handler.queue[ctx.guild][0].song
+            song = player.current_queue()[0]
             embed_message.add_field(name=f"⏯️ The music is back on track!",
                                     value=f"[{song.title}]({song.url}) by "
                                           f"[{song.channel}]({song.channel_url}) continues to play.",
@@ -197,7 +577,7 @@ class Music(commands.Cog):
         elif player and player.voice.is_playing():
             embed_message.set_author(name="Keep the Party Rolling!")
 
-            song = player.handler.queue[ctx.guild][0].song
+            song = player.current_queue()[0]
             embed_message.add_field(name="",
                                     value=f"🎵 [{song.title}]({song.url}) by "
                                          f"[{song.channel}]({song.channel_url}) is already setting the mood!",
@@ -244,7 +624,7 @@ class Music(commands.Cog):
 
             embed_message.set_author(name="Music Paused!")
 
-            song = player.handler.queue[ctx.guild][0].song
+            song = player.current_queue()[0]
             embed_message.add_field(name="",
                                     value=f"⏸️ [{song.title}]({song.url}) by "
                                           f"[{song.channel}]({song.channel_url}) is taking a short break.",
@@ -337,14 +717,11 @@ class Music(commands.Cog):
 
             embed_message.colour = discord.Colour.dark_grey()
         else:
-            embed_message.set_author(name=f"Queue Overview")
-
-            embed_message.title = f"🎶 Here's what's lined up in your music queue:"
+            # Only the first page is rendered, the buttons render the others on demand
+            view = queue_view.QueueView(current_queue)
+            view.message = await ctx.send(embed=view.render(), view=view)
+            return
 
-            embed_message.description = ''
-            for index, source in enumerate(current_queue[1:]):
-                embed_message.description += f'**{index + 1}**. [{source.song.title}]({source.song.url})\n\n'
-            embed_message.colour = discord.Colour.dark_grey()
         await ctx.send(embed=embed_message)
 
     @commands.command()
@@ -362,7 +739,7 @@ class Music(commands.Cog):
 
         if player and player.voice.is_playing():
             song = await player.skip()
-            skipped_song = player.handler.queue[ctx.guild][0].song
+            skipped_song = player.current_queue()[0]
 
             if song:
                 embed_message.set_author(name="Song Skipped")
@@ -445,9 +822,9 @@ class Music(commands.Cog):
             await ctx.send(embed=embed_message)
             return
 
-        source = player.now_playing()
+        song = player.now_playing()
 
-        if source is None:
+        if song is None:
             embed_message.set_author(name="Nothing is Playing")
 
             embed_message.add_field(name=f"The music station is currently silent "
@@ -459,40 +836,40 @@ class Music(commands.Cog):
             embed_message.colour = discord.Colour.dark_grey()
         else:
             embed_message.set_author(name=f'Currently playing:')
-            embed_message.set_thumbnail(url=source.song.thumbnail)
+            embed_message.set_thumbnail(url=song.thumbnail)
 
-            embed_message.title = f"{source.song.title} - ({source.song.duration})"
-            embed_message.url = source.song.url
+            embed_message.title = f"{song.title} - ({song.duration})"
+            embed_message.url = song.url
 
             embed_message.add_field(name="By",
-                                    value=f"[{source.song.channel}]({source.song.channel_url})", inline=False)
+                                    value=f"[{song.channel}]({song.channel_url})", inline=False)
             embed_message.add_field(name="Likes",
-                                    value=f":thumbup: {source.song.likes}", inline=True)
+                                    value=f":thumbup: {song.likes}", inline=True)
             embed_message.add_field(name="Views",
-                                    value=f":eye: {source.song.views}", inline=True)
+                                    value=f":eye: {song.views}", inline=True)
             embed_message.add_field(name="Uploaded",
                                     value=f":date: "
-                                          f"{datetime.strptime(source.song.date, '%Y%m%d').strftime('%Y/%m/%d')}",
+                                          f"{datetime.strptime(song.date, '%Y%m%d').strftime('%Y/%m/%d')}",
                                     inline=False)
-            requester_mention = source.song.requester.mention if source.song.requester is not None else ''
+            requester_mention = song.requester.mention if song.requester is not None else ''
             embed_message.add_field(name="Requested By:",
                                     value=f"{requester_mention}", inline=False)
-            delta_time = str((datetime.now() - source.song.start_time))
-            completed_percentage =\
-                (round((datetime.now() - source.song.start_time).total_seconds()) / source.song.duration_seconds * 100)
+            # The time spent paused does not count
+            elapsed = round(player.elapsed())
+            completed_percentage = elapsed / song.duration_seconds * 100
             completed_song: int
-            completed_song = math.ceil(completed_percentage) // 10
-            formatted_time = datetime.strptime(delta_time, '%H:%M:%S.%f').strftime('%H:%M:%S')
+            completed_song = min(math.ceil(completed_percentage) // 10, 10)
+            formatted_time = f"{elapsed // 3600:02d}:{elapsed // 60 % 60:02d}:{elapsed % 60:02d}"
             embed_message.add_field(name="Playback Position",
                                     value=f":arrow_forward: "
                                           f"{formatted_time} - "
                                           f"[{completed_song * ' ⬜ '}{(10 - completed_song) * ' ⬛ '}] "
-                                          f"- {source.song.duration}", inline=False)
-            next_song = player.handler.queue[ctx.guild][1] if len(player.handler.queue[ctx.guild]) > 1 else None
+                                          f"- {song.duration}", inline=False)
+            next_song = player.current_queue()[1] if len(player.current_queue()) > 1 else None
 
             if next_song is not None:
                 embed_message.add_field(name="Next",
-                                        value=f":track_next: {next_song.song.title}", inline=False)
+                                        value=f":track_next: {next_song.title}", inline=False)
             else:
                 embed_message.add_field(name="Next",
                                         value=f":no_entry: Nothing left in the queue", inline=False)
@@ -1,15 +1,118 @@
 import os
 import logging
+import multiprocessing
 import pathlib
-from logging.config import dictConfig
 import dotenv
 
+from utils import logging_utils
+
 dotenv.load_dotenv()
 
 BOT_SECRET = os.getenv("TOKEN")
 
 BASE_DIR = pathlib.Path(__file__).parent
 CMDS_DIR = BASE_DIR / "commands"
+CACHE_DIR = BASE_DIR / "cache"
+
+METADATA_DB = CACHE_DIR / "metadata.sqlite3"
+
+SEARCH_TIMEOUT = 5.0
+SEARCH_CONCURRENCY = 8
+SEARCH_CACHE_SIZE = 4096
+SEARCH_CACHE_TTL = 6 * 60 * 60
+
+PLAY_BATCH_CONCURRENCY = 4
+# A !play with several songs answers with one message, edited at most every PLAY_PROGRESS_INTERVAL seconds
+PLAY_PROGRESS_INTERVAL = 1.5
+PLAYLIST_PAGE_SIZE = 50
+
+PREFETCH_SECONDS = 10
+
+# Number of songs per page of !queue, and how long its buttons keep working, in seconds
+QUEUE_PAGE_SIZE = 10
+QUEUE_VIEW_TIMEOUT = 120
+
+# Players that stayed idle (not playing) for PLAYER_IDLE_TIMEOUT seconds are disconnected and forgotten
+PLAYER_IDLE_TIMEOUT = 5 * 60
+PLAYER_SWEEP_INTERVAL = 30
+
+# The queues and the position in the playing songs are checkpointed to SESSIONS_DB, and resumed after a reload
+# of the Music cog or a restart of the bot. The positions are saved every SESSION_CHECKPOINT_INTERVAL seconds
+SESSION_PERSISTENCE = True
+SESSIONS_DB = CACHE_DIR / "sessions.sqlite3"
+SESSION_CHECKPOINT_INTERVAL = 5
+
+DEFAULT_VOLUME = 0.5
+# Opt-in: Opus streams are sent to Discord without being decoded by the bot. The packets are copied as they are
+# only when the volume is 1.0 (DEFAULT_VOLUME = 1.0 plays everything 6 dB louder), otherwise ffmpeg re-encodes
+# them at the right volume
+OPUS_PASSTHROUGH = False
+
+# Tracks played at least AUDIO_CACHE_PLAY_THRESHOLD times are downloaded and played from the disk
+AUDIO_CACHE_ENABLED = False
+AUDIO_CACHE_DIR = CACHE_DIR / "audio"
+AUDIO_CACHE_MAX_BYTES = 2 * 1024 ** 3
+AUDIO_CACHE_PLAY_THRESHOLD = 3
+
+# The integrated loudness of every track is measured once, the playback then applies a static gain
+LOUDNESS_NORMALIZATION = True
+LOUDNESS_TARGET = -14.0
+LOUDNESS_MAX_GAIN = 2.0
+LOUDNESS_ANALYSIS_TIMEOUT = 120.0
+# At most LOUDNESS_MAX_PENDING tracks are being measured or waiting. The files of the audio cache are measured in
+# full. A stream is downloaded and decoded a second time to be measured, only its first LOUDNESS_STREAM_WINDOW
+# seconds are (None measures it in full). LOUDNESS_ANALYZE_STREAMS = False only measures the cached files, the
+# normalization then needs the audio cache
+LOUDNESS_MAX_PENDING = 8
+LOUDNESS_ANALYZE_STREAMS = True
+LOUDNESS_STREAM_WINDOW = 30.0
+# Opus streams keep the codec copy when their correction is smaller than this, in dB
+LOUDNESS_PASSTHROUGH_TOLERANCE_DB = 1.5
+
+# Number of 20 ms frames read ahead from ffmpeg, to absorb network and CPU jitter
+READAHEAD_FRAMES = 50
+
+# "thread" shares one YoutubeDL on a thread pool, "process" runs the extractions on warm worker processes
+EXTRACTION_BACKEND = "thread"
+EXTRACTION_WORKERS = 2
+EXTRACTION_TIMEOUT = 30.0
+EXTRACTION_MAX_JOBS = 100
+# The yt-dlp extractors that are registered, as names or regexes (see yt-dlp's --use-extractors), None registers
+# all of them. ["youtube", "youtube:tab", "youtube:playlist"] builds every YoutubeDL instance about 4 times faster,
+# but !play then only accepts YouTube links
+YTDL_EXTRACTORS = None
+
+# Prometheus metrics served on http://METRICS_HOST:METRICS_PORT/metrics (each cluster adds its id to the port)
+METRICS_ENABLED = True
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9464
+# How often the event loop lag is measured, in seconds
+METRICS_LOOP_LAG_INTERVAL = 1.0
+
+# AutoShardedBot is used when SHARDED is True, or when the shards are spread across processes by cluster.py
+SHARDED = False
+# None uses the number of shards recommended by Discord
+SHARD_COUNT = None
+
+# cluster.py runs the shards in CLUSTER_COUNT processes, each one reporting its health every
+# CLUSTER_HEALTH_INTERVAL seconds. A cluster that stays silent for CLUSTER_HEALTH_TIMEOUT seconds is restarted
+CLUSTER_COUNT = os.cpu_count() or 1
+CLUSTER_HEALTH_INTERVAL = 15
+CLUSTER_HEALTH_TIMEOUT = 60
+CLUSTER_READY_TIMEOUT = 120
+CLUSTER_RESTART_DELAY = 5
+
+# Opt-in: the log handlers run on background threads fed by queues, so logging never makes the event loop wait
+# on the console or the disk
+LOG_QUEUED = False
+# None truncates logs/infos.log at startup, "size" rotates it every LOG_MAX_BYTES, "time" at LOG_ROTATE_WHEN
+# (see logging.handlers.TimedRotatingFileHandler). LOG_BACKUP_COUNT rotated files are kept
+LOG_ROTATION = None
+LOG_MAX_BYTES = 10 * 1024 ** 2
+LOG_ROTATE_WHEN = "midnight"
+LOG_BACKUP_COUNT = 5
+# Writes the log file as compact JSON lines, the console output stays readable
+LOG_JSON = False
 
 LOGGING_CONFIG = {
     "version": 1,
@@ -20,6 +123,9 @@ LOGGING_CONFIG = {
         },
         "standard": {
             "format": "%(levelname)-10s - %(name)-15s : %(message)s"
+        },
+        "json": {
+            "()": "utils.logging_utils.JsonFormatter"
         }
     },
     "handlers": {
@@ -33,13 +139,10 @@ LOGGING_CONFIG = {
             'class': "logging.StreamHandler",
             'formatter': "standard"
         },
-        "file": {
-            'level': "INFO",
-            'class': "logging.FileHandler",
-            'filename': "logs/infos.log",
-            'mode': "w",
-            'formatter': "standard"
-        }
+        "file": logging_utils.file_handler("logs/infos.log", level="INFO",
+                                           formatter="json" if LOG_JSON else "standard", rotation=LOG_ROTATION,
+                                           max_bytes=LOG_MAX_BYTES, when=LOG_ROTATE_WHEN,
+                                           backup_count=LOG_BACKUP_COUNT)
     },
     "loggers": {
         "bot": {
@@ -55,4 +158,6 @@ LOGGING_CONFIG = {
     }
 }
 
-dictConfig(LOGGING_CONFIG)
+# Worker processes re-import the main module, they must not reconfigure (and truncate) the bot's logs
+if multiprocessing.parent_process() is None:
+    logging_utils.configure(LOGGING_CONFIG, queued=LOG_QUEUED)
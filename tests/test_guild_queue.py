@@ -0,0 +1,104 @@
+import random
+
+import pytest
+
+from utils.guild_queue import GuildQueue
+
+
+def make_queue(items=(), chunk_size=GuildQueue.chunk_size) -> GuildQueue:
+    queue = GuildQueue()
+    queue.chunk_size = chunk_size
+    queue.extend(items)
+
+    return queue
+
+
+def assert_same(queue: GuildQueue, model: list):
+    assert len(queue) == len(model)
+    assert list(queue) == model
+
+    for index in range(-len(model), len(model)):
+        assert queue[index] == model[index]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 8])
+def test_matches_list_model(chunk_size):
+    rng = random.Random(chunk_size)
+    queue = make_queue(range(20), chunk_size)
+    model = list(range(20))
+    version = queue.version
+    counter = 20
+
+    for _ in range(2000):
+        operation = rng.choice(["append", "advance", "pop", "pop_last", "insert", "move", "page", "slice"])
+
+        if operation == "append":
+            queue.append(counter)
+            model.append(counter)
+            counter += 1
+        elif operation == "insert":
+            index = rng.randint(-len(model) - 2, len(model) + 2)
+            queue.insert(index, counter)
+            model.insert(index, counter)
+            counter += 1
+        elif not model:
+            continue
+        elif operation == "advance":
+            assert queue.advance() == model.pop(0)
+        elif operation == "pop":
+            index = rng.randrange(-len(model), len(model))
+            assert queue.pop(index) == model.pop(index)
+        elif operation == "pop_last":
+            assert queue.pop() == model.pop()
+        elif operation == "move":
+            source, destination = rng.randrange(len(model)), rng.randrange(len(model))
+            queue.move(source, destination)
+            model.insert(destination, model.pop(source))
+        elif operation == "page":
+            start, size = rng.randrange(len(model) + 2), rng.randrange(12)
+            assert queue.page(start, size) == model[start:start + size]
+            continue
+        elif operation == "slice":
+            start, stop = sorted(rng.randrange(-len(model) - 2, len(model) + 2) for _ in range(2))
+            assert queue[start:stop] == model[start:stop]
+            assert queue[start:stop:2] == model[start:stop:2]
+            continue
+
+        assert queue.version > version
+        version = queue.version
+        assert_same(queue, model)
+
+
+def test_long_queue_drains_in_order():
+    queue = make_queue(range(1000), chunk_size=7)
+
+    assert queue.page(500, 3) == [500, 501, 502]
+    assert [queue.advance() for _ in range(1000)] == list(range(1000))
+    assert len(queue) == 0
+
+
+def test_empty_queue():
+    queue = make_queue()
+
+    assert list(queue) == []
+    assert queue.page(0, 10) == []
+
+    with pytest.raises(IndexError):
+        queue[0]
+    with pytest.raises(IndexError):
+        queue.advance()
+    with pytest.raises(IndexError):
+        queue.pop()
+
+
+def test_clear():
+    queue = make_queue(range(50), chunk_size=4)
+    version = queue.version
+
+    queue.clear()
+
+    assert queue.version > version
+    assert_same(queue, [])
+
+    queue.append("again")
+    assert_same(queue, ["again"])
@@ -0,0 +1,95 @@
+import asyncio
+
+from benchmarks import fixtures
+from utils import audio
+from utils import metrics
+from utils import music_player
+from utils import ytdl_utils
+
+
+def make_song(video_id: str) -> ytdl_utils.Song:
+    return ytdl_utils.song_from_entry({"id": video_id, "title": video_id, "duration": 5})
+
+
+def test_play_drops_the_songs_that_cannot_start(monkeypatch, tmp_path):
+    wav = fixtures.write_wav(tmp_path / "fixture.wav", seconds=5)
+
+    async def from_song(song, loop=None, offset=0.0):
+        if song.video_id.startswith("A"):
+            raise RuntimeError("the stream URL expired")
+
+        return ytdl_utils.YTDLSource(audio.BufferedAudio(fixtures.WavPCM(wav)), song=song, volume=0.5)
+
+    monkeypatch.setattr(ytdl_utils.YTDLSource, "from_song", from_song)
+
+    async def run():
+        bot = fixtures.FakeBot(asyncio.get_running_loop())
+        guild = bot.add_guild(1)
+        handler = music_player.PlayerHandler()
+        player = handler._create(bot, guild.id, 0)
+        failures = sum(metrics.playback_failures._values.values())
+
+        # A head that cannot start is dropped instead of blocking the queue
+        player.add(make_song("AAAAAAAAAAA"))
+        song, skipped = await player.play()
+
+        assert song is None
+        assert [(song.video_id, str(error)) for song, error in skipped] == [("AAAAAAAAAAA", "the stream URL expired")]
+        assert list(player.current_queue()) == []
+        assert player.is_idle()
+
+        # The next songs play, the failing ones in front of them are dropped too
+        player.add(make_song("AAAAAAAAAA1"))
+        player.add(make_song("BBBBBBBBBB0"))
+        player.add(make_song("BBBBBBBBBB1"))
+        song, skipped = await player.play()
+
+        assert song.video_id == "BBBBBBBBBB0"
+        assert [song.video_id for song, _ in skipped] == ["AAAAAAAAAA1"]
+        assert [song.video_id for song in player.current_queue()] == ["BBBBBBBBBB0", "BBBBBBBBBB1"]
+        assert not player.is_idle()
+        assert guild.voice_client.is_playing()
+        assert sum(metrics.playback_failures._values.values()) == failures + 2
+
+        # The audio thread calls back into the loop once the song is stopped, the loop must still be running
+        voice = guild.voice_client
+        await handler.evict(guild.id)
+        await asyncio.get_running_loop().run_in_executor(None, voice.wait, 1)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+
+
+def test_elapsed_leaves_out_the_pauses(monkeypatch, tmp_path):
+    wav = fixtures.write_wav(tmp_path / "fixture.wav", seconds=5)
+
+    async def from_song(song, loop=None, offset=0.0):
+        return ytdl_utils.YTDLSource(audio.BufferedAudio(fixtures.WavPCM(wav)), song=song, volume=0.5)
+
+    monkeypatch.setattr(ytdl_utils.YTDLSource, "from_song", from_song)
+
+    async def run():
+        bot = fixtures.FakeBot(asyncio.get_running_loop())
+        guild = bot.add_guild(1)
+        handler = music_player.PlayerHandler()
+        player = handler._create(bot, guild.id, 0)
+
+        player.add(make_song("BBBBBBBBBB0"))
+        await player.play(offset=2.0)
+        await asyncio.sleep(0.1)
+
+        await player.pause()
+        paused = player.elapsed()
+        await asyncio.sleep(0.3)
+
+        # The position is frozen during the pause and goes on from it afterwards
+        assert player.elapsed() == paused
+        await player.resume()
+        assert 2.1 <= player.elapsed() < paused + 0.05
+
+        voice = guild.voice_client
+        await handler.evict(guild.id)
+        await asyncio.get_running_loop().run_in_executor(None, voice.wait, 1)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(run())
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import types
+
+import discord
+
+from utils import music_utils
+
+
+def test_resolve_in_order_keeps_input_order_and_errors():
+    delays = {"a": 0.03, "b": 0.0, "c": 0.02, "d": 0.01, "e": 0.0}
+    running = 0
+    peak = 0
+
+    async def resolve(item):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+
+        await asyncio.sleep(delays[item])
+        running -= 1
+
+        if item == "c":
+            raise ValueError("no video for c")
+
+        return item.upper()
+
+    async def collect():
+        return [result async for result in music_utils.resolve_in_order(delays, resolve, limit=2)]
+
+    results = asyncio.run(collect())
+
+    assert [(item, song) for item, song, _ in results] == [("a", "A"), ("b", "B"), ("c", None), ("d", "D"),
+                                                           ("e", "E")]
+    assert [type(error) for _, _, error in results] == [type(None)] * 2 + [ValueError] + [type(None)] * 2
+    assert peak == 2
+
+
+class FakeMessage:
+    def __init__(self, embed):
+        self.embed = embed
+        self.edits = 0
+        self.error: Exception | None = None
+
+    async def edit(self, embed):
+        if self.error is not None:
+            raise self.error
+
+        self.embed = embed
+        self.edits += 1
+
+
+class FakeContext:
+    def __init__(self):
+        self.messages: list[FakeMessage] = []
+
+    async def send(self, embed):
+        self.messages.append(FakeMessage(embed))
+        return self.messages[-1]
+
+
+def embed(title: str) -> discord.Embed:
+    return discord.Embed(title=title)
+
+
+def test_progress_message_coalesces_updates():
+    ctx = FakeContext()
+
+    async def run():
+        progress = music_utils.ProgressMessage(ctx, interval=0.05)
+
+        for index in range(20):
+            await progress.update(embed(f"update {index}"))
+
+        # A single delayed edit shows the latest pending embed
+        await asyncio.sleep(0.1)
+        assert ctx.messages[0].embed.title == "update 19"
+
+        await progress.update(embed("late"))
+        await progress.finish(embed("done"))
+
+    asyncio.run(run())
+
+    assert len(ctx.messages) == 1
+    assert ctx.messages[0].edits <= 3
+    assert ctx.messages[0].embed.title == "done"
+
+
+def test_progress_message_logs_failed_delayed_edit(caplog):
+    ctx = FakeContext()
+    loop_errors = []
+
+    async def run():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: loop_errors.append(context))
+        progress = music_utils.ProgressMessage(ctx, interval=0.05)
+
+        await progress.update(embed("first"))
+        ctx.messages[0].error = discord.HTTPException(types.SimpleNamespace(status=500, reason="Server Error"),
+                                                      "unavailable")
+
+        await progress.update(embed("second"))
+        await asyncio.sleep(0.1)
+
+    with caplog.at_level(logging.WARNING, logger="bot"):
+        asyncio.run(run())
+
+    assert ctx.messages[0].embed.title == "first"
+    assert "Could not update the progress message" in caplog.text
+    assert loop_errors == []
@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import array
+import threading
+import time
+from typing import Callable
+
+import discord
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import audioop
+except ImportError:
+    audioop = None
+
+FRAME_SIZE = discord.opus.Encoder.FRAME_SIZE
+FRAME_SAMPLES = FRAME_SIZE // 2
+CHANNELS = discord.opus.Encoder.CHANNELS
+
+FRAME_DURATION = discord.opus.Encoder.FRAME_LENGTH / 1000
+# Opus packets are variable in size, a ring slot must hold the largest one Discord accepts
+OPUS_SLOT_SIZE = 4000
+PCM_SILENCE = bytes(FRAME_SIZE)
+
+# Without NumPy a ramp is applied as a staircase of this many constant gain steps per frame
+FALLBACK_RAMP_STEPS = 8
+
+
+def _scale_fallback(data: bytes, gain: float) -> bytes:
+    if audioop is not None:
+        return audioop.mul(data, 2, gain)
+
+    samples = array.array("h", data)
+    for index, sample in enumerate(samples):
+        samples[index] = max(-32768, min(32767, int(sample * gain)))
+
+    return samples.tobytes()
+
+
+class GainTransformer(discord.AudioSource):
+    """
+    Applies a volume to a PCM source, as a replacement of :class:`discord.PCMVolumeTransformer`.
+
+    With NumPy the frame is scaled with vector operations on preallocated buffers, only the returned bytes
+    are allocated per frame. Volume changes are ramped linearly over **ramp_frames** frames, so they do not
+    click. Without NumPy the scaling falls back to audioop (or plain Python as a last resort).
+
+    Attributes:
+        original:   :class:`discord.AudioSource`: The PCM source being transformed.
+
+        ramp_frames:    :class:`int`: The number of 20 ms frames a volume change is spread over.
+
+    """
+
+    def __init__(self, original: discord.AudioSource, volume: float = 1.0, ramp_frames: int = 1):
+        if original.is_opus():
+            raise discord.ClientException("AudioSource must not be Opus encoded.")
+
+        self.original = original
+        self.ramp_frames = max(ramp_frames, 1)
+
+        self._volume = max(volume, 0.0)
+        self._current = self._volume
+        self._step = 0.0
+
+        if numpy is not None:
+            self._samples = numpy.empty(FRAME_SAMPLES, dtype=numpy.float32)
+            self._gains = numpy.empty(FRAME_SAMPLES, dtype=numpy.float32)
+            self._output = numpy.empty(FRAME_SAMPLES, dtype=numpy.int16)
+            # Position of every interleaved sample inside the frame, from 0 to 1, used to build the ramps
+            self._ramp = numpy.repeat(numpy.linspace(0.0, 1.0, FRAME_SAMPLES // CHANNELS, dtype=numpy.float32),
+                                      CHANNELS)
+
+    @property
+    def volume(self) -> float:
+        """The target volume, as a float percentage (1.0 for 100%)"""
+
+        return self._volume
+
+    @volume.setter
+    def volume(self, value: float):
+        self._volume = max(value, 0.0)
+        self._step = (self._volume - self._current) / self.ramp_frames
+
+    def cleanup(self):
+        self.original.cleanup()
+
+    def _next_gain(self) -> tuple[float, float]:
+        """Returns the gain at the start and at the end of the next frame"""
+
+        start = self._current
+        if start == self._volume:
+            return start, start
+
+        end = start + self._step
+        if (self._step > 0 and end > self._volume) or (self._step < 0 and end < self._volume):
+            end = self._volume
+
+        self._current = end
+
+        return start, end
+
+    def read(self) -> bytes:
+        data = self.original.read()
+        if not data:
+            return data
+
+        start, end = self._next_gain()
+        if start == end == 1.0:
+            return data
+
+        if numpy is None or len(data) != FRAME_SIZE:
+            return self._read_fallback(data, start, end)
+
+        samples = numpy.frombuffer(data, dtype=numpy.int16)
+
+        if start == end:
+            numpy.multiply(samples, numpy.float32(start), out=self._samples)
+        else:
+            numpy.multiply(self._ramp, end - start, out=self._gains)
+            numpy.add(self._gains, start, out=self._gains)
+            numpy.multiply(samples, self._gains, out=self._samples)
+
+        # Attenuating can never overflow, clipping is only needed when amplifying
+        if max(start, end) > 1.0:
+            numpy.clip(self._samples, -32768, 32767, out=self._samples)
+        numpy.copyto(self._output, self._samples, casting="unsafe")
+
+        return self._output.tobytes()
+
+    @staticmethod
+    def _read_fallback(data: bytes, start: float, end: float) -> bytes:
+        if start == end:
+            return _scale_fallback(data, start)
+
+        # Steps are cut on whole stereo samples, so the channels are never swapped
+        step_size = max(len(data) // FALLBACK_RAMP_STEPS // (2 * CHANNELS) * (2 * CHANNELS), 2 * CHANNELS)
+        chunks = []
+
+        for offset in range(0, len(data), step_size):
+            position = min(offset / len(data), 1.0)
+            chunks.append(_scale_fallback(data[offset:offset + step_size], start + (end - start) * position))
+
+        return b"".join(chunks)
+
+
+class BufferedAudio(discord.AudioSource):
+    """
+    Reads a source ahead of playback, on a background thread, into a ring of preallocated frames.
+
+    The player thread then reads from memory instead of the ffmpeg pipe, so network hiccups, a busy CPU or
+    GIL contention do not stall it. **read** never blocks for longer than one frame: if the ring is still
+    empty after that, a frame of silence is returned and counted as an underrun.
+
+    Attributes:
+        original:   :class:`discord.AudioSource`: The source being read ahead (PCM or Opus).
+
+        depth:  :class:`int`: The number of frames the ring holds.
+
+        underruns:  :class:`int`: The number of reads that found the ring empty.
+
+        high_water: :class:`int`: The highest number of frames that were buffered at the same time.
+
+        on_first_frame: :class:`Callable[[float], None]`: Called from the read-ahead thread with the number of
+        seconds it took to get the first frame.
+
+    """
+
+    def __init__(self, original: discord.AudioSource, depth: int = 50,
+                 on_first_frame: Callable[[float], None] | None = None):
+        self.original = original
+        self.depth = max(depth, 1)
+        self.on_first_frame = on_first_frame
+
+        self.underruns = 0
+        self.high_water = 0
+
+        self._opus = original.is_opus()
+        self._slot_size = OPUS_SLOT_SIZE if self._opus else FRAME_SIZE
+        self._silence = discord.opus.OPUS_SILENCE if self._opus else PCM_SILENCE
+
+        self._ring = bytearray(self.depth * self._slot_size)
+        self._lengths = [0] * self.depth
+        self._head = 0
+        self._count = 0
+
+        self._condition = threading.Condition()
+        self._finished = False
+        self._stopped = False
+
+        self._thread = threading.Thread(target=self._fill, name="audio-read-ahead", daemon=True)
+        self._thread.start()
+
+    def _fill(self):
+        started = time.perf_counter()
+
+        try:
+            data = self.original.read()
+            if data and self.on_first_frame is not None:
+                self.on_first_frame(time.perf_counter() - started)
+
+            while not self._stopped:
+                with self._condition:
+                    while self._count == self.depth and not self._stopped:
+                        self._condition.wait()
+
+                    if self._stopped:
+                        return
+                    if not data:
+                        break
+
+                    data = data[:self._slot_size]
+                    slot = (self._head + self._count) % self.depth
+                    offset = slot * self._slot_size
+
+                    self._ring[offset:offset + len(data)] = data
+                    self._lengths[slot] = len(data)
+                    self._count += 1
+                    self.high_water = max(self.high_water, self._count)
+
+                    self._condition.notify_all()
+
+                data = self.original.read()
+        finally:
+            with self._condition:
+                self._finished = True
+                self._condition.notify_all()
+
+    @property
+    def buffered(self) -> int:
+        """The number of frames currently buffered"""
+
+        return self._count
+
+    def is_opus(self) -> bool:
+        return self._opus
+
+    def read(self) -> bytes:
+        with self._condition:
+            if not self._count and not self._finished:
+                self._condition.wait(FRAME_DURATION)
+
+            if not self._count:
+                if self._finished:
+                    return b""
+
+                self.underruns += 1
+                return self._silence
+
+            offset = self._head * self._slot_size
+            data = bytes(self._ring[offset:offset + self._lengths[self._head]])
+
+            self._head = (self._head + 1) % self.depth
+            self._count -= 1
+            self._condition.notify_all()
+
+        return data
+
+    def cleanup(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+        # Killing ffmpeg unblocks a read that is waiting on its pipe
+        self.original.cleanup()
+        self._thread.join(FRAME_DURATION)
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import os
+import pathlib
+import threading
+
+import yt_dlp
+
+import settings
+from utils import metadata_cache as metadata_cache_utils
+
+logger = settings.logging.getLogger("bot")
+
+
+class AudioCache:
+    """
+    A size-bounded directory of downloaded audio files, for the tracks that are played the most.
+
+    A track is downloaded in the background once its play count reaches **threshold**. The files are named
+    **<video id>.<codec>.<ext>** and the least recently played ones are deleted when the directory grows
+    over **max_bytes**.
+
+    Attributes:
+        directory:  :class:`pathlib.Path`: The directory the files are stored in.
+
+        max_bytes:  :class:`int`: The maximum total size of the files.
+
+        threshold:  :class:`int`: The number of plays after which a track is downloaded.
+
+    """
+
+    def __init__(self, directory: str | pathlib.Path, max_bytes: int, threshold: int, ytdl_options: dict,
+                 metadata_cache: metadata_cache_utils.MetadataCache):
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+        self.threshold = threshold
+        self.metadata_cache = metadata_cache
+
+        self._ytdl_options = {
+            **ytdl_options,
+            "format": "bestaudio[acodec=opus]/bestaudio",
+            "outtmpl": str(self.directory / "%(id)s.%(acodec)s.%(ext)s")
+        }
+        self._ytdl: yt_dlp.YoutubeDL | None = None
+
+        self._lock = threading.Lock()
+        self._files: dict[str, pathlib.Path] | None = None
+        self._downloading: set[str] = set()
+        # Downloads are throttled to one at a time, they should never compete with the streams
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="audio-cache")
+
+    def _scan(self) -> dict[str, pathlib.Path]:
+        if self._files is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._files = {path.name.split(".", 1)[0]: path for path in self.directory.iterdir()
+                           if path.is_file() and not path.name.endswith(".part")}
+
+        return self._files
+
+    def lookup(self, video_id: str) -> tuple[pathlib.Path, str] | None:
+        """
+        Returns the local file of a track and its codec, marking it as recently used.
+
+        Blocking, meant to be run in an executor.
+        """
+        with self._lock:
+            path = self._scan().get(video_id)
+
+            if path is None:
+                return None
+
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                del self._files[video_id]
+                return None
+
+        return path, path.name.split(".")[1]
+
+    def _download(self, video_id: str, url: str):
+        if self._ytdl is None:
+            self._ytdl = yt_dlp.YoutubeDL(self._ytdl_options)
+
+        try:
+            data = self._ytdl.extract_info(url, download=True)
+            if data is None:
+                return
+
+            path = pathlib.Path(self._ytdl.prepare_filename(data))
+            with self._lock:
+                if path.exists():
+                    self._scan()[video_id] = path
+                self._evict()
+        except Exception as error:
+            logger.warning(f"Could not cache the audio of {url}: {error}")
+        finally:
+            with self._lock:
+                self._downloading.discard(video_id)
+
+    def _evict(self):
+        """Deletes the least recently used files until the directory fits in **max_bytes**"""
+
+        files = sorted(((path.stat(), video_id, path) for video_id, path in self._scan().items() if path.exists()),
+                       key=lambda entry: entry[0].st_mtime)
+        total = sum(stat.st_size for stat, _, _ in files)
+
+        for stat, video_id, path in files:
+            if total <= self.max_bytes:
+                break
+
+            path.unlink(missing_ok=True)
+            del self._files[video_id]
+            total -= stat.st_size
+
+    async def record_play(self, video_id: str, url: str, loop=None):
+        """
+        Counts a play of the track and starts downloading it in the background once it crosses the threshold.
+
+        Args:
+            video_id:   :class:`str`: The id of the video.
+            url:    :class:`str`: The URL of the video.
+            loop:   :class:`asyncio.AbstractEventLoop`: The loop used to run the blocking work in an executor.
+
+        """
+        loop = loop or asyncio.get_event_loop()
+
+        plays = await loop.run_in_executor(None, self.metadata_cache.record_play, video_id)
+        if plays < self.threshold:
+            return
+
+        with self._lock:
+            if video_id in self._downloading or (self._files is not None and video_id in self._files):
+                return
+            self._downloading.add(video_id)
+
+        loop.run_in_executor(self._executor, self._download, video_id, url)
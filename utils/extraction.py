@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import multiprocessing
+import threading
+import time
+
+import yt_dlp
+
+# This module is imported by the worker processes, so it must not import settings or discord
+
+# The keys of an extract_info result that are kept, everything else (formats, thumbnails, subtitles...) is dropped
+record_keys = ("id", "url", "title", "thumbnail", "like_count", "view_count", "duration_string",
+               "duration", "upload_date", "uploader", "uploader_url", "acodec", "ext")
+
+_worker_ytdl: yt_dlp.YoutubeDL | None = None
+
+
+class ExtractionTimeout(Exception):
+    """The extraction did not finish in time"""
+
+
+class ExtractionFailed(Exception):
+    """The extractor did not return any data"""
+
+
+def make_record(data: dict | None) -> dict:
+    """
+    Trims an **extract_info** result down to a small, picklable record.
+
+    Args:
+        data:   :class:`dict`: The info dict returned by yt-dlp.
+
+    Returns:
+        dict: The record holding only the keys listed in **record_keys**.
+
+    """
+    if data is None:
+        raise ExtractionFailed("The extractor did not return any data")
+
+    return {key: data.get(key) for key in record_keys}
+
+
+def _init_worker(options: dict):
+    global _worker_ytdl
+
+    # The default extractors (or the ones allowed by the options) are registered by the constructor
+    _worker_ytdl = yt_dlp.YoutubeDL(options)
+
+
+def _warm_worker(delay: float) -> bool:
+    # Keeps the worker busy for a moment, so every warm-up job lands on a different process
+    time.sleep(delay)
+
+    return _worker_ytdl is not None
+
+
+def _extract_in_worker(url: str, download: bool) -> dict:
+    return make_record(_worker_ytdl.extract_info(url, download=download))
+
+
+class ThreadBackend:
+    """
+    Runs the extractions on a dedicated thread pool, sharing one YoutubeDL instance.
+
+    Attributes:
+        options:    :class:`dict`: The yt-dlp options.
+
+        workers:    :class:`int`: The number of extraction threads.
+
+        timeout:    :class:`float`: The timeout of one extraction, in seconds.
+
+    """
+
+    def __init__(self, options: dict, workers: int = 4, timeout: float = 30.0):
+        self.options = options
+        self.workers = workers
+        self.timeout = timeout
+
+        self._ytdl: yt_dlp.YoutubeDL | None = None
+        self._ytdl_lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers,
+                                                               thread_name_prefix="extraction")
+
+    def _get_ytdl(self) -> yt_dlp.YoutubeDL:
+        # The first extractions can arrive together, only one of them builds the instance
+        with self._ytdl_lock:
+            if self._ytdl is None:
+                self._ytdl = yt_dlp.YoutubeDL(self.options)
+
+        return self._ytdl
+
+    def _extract(self, url: str, download: bool) -> dict:
+        return make_record(self._get_ytdl().extract_info(url, download=download))
+
+    async def start(self):
+        """Builds the shared YoutubeDL instance on an extraction thread"""
+
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._get_ytdl)
+
+    async def extract(self, url: str, download: bool = False) -> dict:
+        """
+        Extracts the info of a video.
+
+        Args:
+            url:    :class:`str`: The URL of the video.
+            download:   :class:`bool`: Whether the audio is downloaded instead of streamed.
+
+        Returns:
+            dict: The trimmed record of the video (see **make_record**).
+
+        """
+        loop = asyncio.get_running_loop()
+
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(self._executor, self._extract, url, download),
+                                          self.timeout)
+        except asyncio.TimeoutError:
+            raise ExtractionTimeout(f"The extraction of {url} took longer than {self.timeout} seconds")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ProcessBackend(ThreadBackend):
+    """
+    Runs the extractions on a pool of warm worker processes, each one keeping its own YoutubeDL instance.
+
+    yt-dlp's parsing is CPU heavy pure Python, running it in other processes keeps it from holding the GIL
+    of the process feeding the audio frames. Only the trimmed records are sent back to the bot.
+
+    Attributes:
+        options:    :class:`dict`: The yt-dlp options.
+
+        workers:    :class:`int`: The number of worker processes.
+
+        timeout:    :class:`float`: The timeout of one extraction, in seconds.
+
+        max_jobs:   :class:`int`: The number of extractions after which a worker process is replaced.
+
+    """
+
+    def __init__(self, options: dict, workers: int = 2, timeout: float = 30.0, max_jobs: int = 100):
+        self.options = options
+        self.workers = workers
+        self.timeout = timeout
+        self.max_jobs = max_jobs
+
+        self._executor = self._create_executor()
+
+    def _create_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        return concurrent.futures.ProcessPoolExecutor(max_workers=self.workers,
+                                                      mp_context=multiprocessing.get_context("spawn"),
+                                                      initializer=_init_worker,
+                                                      initargs=(self.options,),
+                                                      max_tasks_per_child=self.max_jobs)
+
+    def _recycle(self, executor: concurrent.futures.ProcessPoolExecutor):
+        """
+        Replaces a pool whose worker is stuck in an extraction, the stuck process is killed.
+
+        A timed out job cannot be cancelled once a worker runs it, it would keep that worker until it returns.
+        The other jobs running on the old pool fail with it.
+        """
+        if self._executor is not executor:
+            # Another timeout already replaced it
+            return
+
+        self._executor = self._create_executor()
+
+        # ProcessPoolExecutor has no public way to kill its workers
+        for process in list((executor._processes or {}).values()):
+            process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def start(self):
+        """Spawns all the worker processes, so their YoutubeDL instances are ready before the first request"""
+
+        loop = asyncio.get_running_loop()
+
+        await asyncio.gather(*(loop.run_in_executor(self._executor, _warm_worker, 0.5)
+                               for _ in range(self.workers)))
+
+    async def extract(self, url: str, download: bool = False) -> dict:
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(executor, _extract_in_worker, url, download),
+                                          self.timeout)
+        except asyncio.TimeoutError:
+            self._recycle(executor)
+            raise ExtractionTimeout(f"The extraction of {url} took longer than {self.timeout} seconds")
+
+
+def create_backend(kind: str, options: dict, workers: int, timeout: float, max_jobs: int) -> ThreadBackend:
+    """
+    Creates the extraction backend configured in the settings.
+
+    Args:
+        kind:   :class:`str`: Either **thread** or **process**.
+        options:    :class:`dict`: The yt-dlp options.
+        workers:    :class:`int`: The number of threads or worker processes.
+        timeout:    :class:`float`: The timeout of one extraction, in seconds.
+        max_jobs:   :class:`int`: The number of extractions after which a worker process is replaced.
+
+    Returns:
+        ThreadBackend: The extraction backend.
+
+    """
+    if kind == "process":
+        return ProcessBackend(options, workers, timeout, max_jobs)
+
+    if kind == "thread":
+        return ThreadBackend(options, workers, timeout)
+
+    raise ValueError(f"Unknown extraction backend {kind}")
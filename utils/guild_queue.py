@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import Generic, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+
+class GuildQueue(Generic[T]):
+    """
+    The queue of songs of one guild, the first entry being the song that is playing.
+
+    The entries are stored in chunks of bounded size, indexed by a Fenwick tree over the chunk sizes:
+
+    - appending and advancing (removing the head) are O(1) amortized,
+    - positional access, insertion, removal and moves are O(log n),
+    - a page of k entries is read in O(log n + k), without copying the rest of the queue.
+
+    Attributes:
+        version:    :class:`int`: A counter incremented by every mutation, views can cache against it.
+
+    """
+
+    chunk_size = 256
+
+    def __init__(self, items: Iterable[T] = ()):
+        self.version = 0
+
+        self._chunks: list[deque[T]] = []
+        self._length = 0
+
+        # Fenwick tree over the chunk sizes, rebuilt lazily when chunks are added or removed
+        self._tree: list[int] | None = None
+        # Entries removed from the head of the first chunk since the tree was built
+        self._offset = 0
+
+        self.extend(items)
+
+    def _build(self):
+        size = len(self._chunks)
+        tree = [0] * (size + 1)
+
+        for index, chunk in enumerate(self._chunks, 1):
+            tree[index] += len(chunk)
+            parent = index + (index & -index)
+            if parent <= size:
+                tree[parent] += tree[index]
+
+        self._tree = tree
+        self._offset = 0
+
+    def _invalidate(self):
+        self._tree = None
+        self._offset = 0
+
+    def _tree_add(self, chunk_index: int, delta: int):
+        if self._tree is None:
+            return
+
+        index = chunk_index + 1
+        while index < len(self._tree):
+            self._tree[index] += delta
+            index += index & -index
+
+    def _locate(self, index: int) -> tuple[int, int]:
+        """Returns the chunk holding the entry at the given position and the position inside that chunk"""
+
+        if self._tree is None:
+            self._build()
+
+        remaining = index + self._offset
+        position = 0
+        step = 1 << (len(self._tree) - 1).bit_length() - 1
+
+        while step:
+            if position + step < len(self._tree) and self._tree[position + step] <= remaining:
+                position += step
+                remaining -= self._tree[position]
+            step >>= 1
+
+        if position == 0:
+            remaining -= self._offset
+
+        return position, remaining
+
+    def _normalize(self, index: int) -> int:
+        if index < 0:
+            index += self._length
+
+        if not 0 <= index < self._length:
+            raise IndexError("queue index out of range")
+
+        return index
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[T]:
+        for chunk in self._chunks:
+            yield from chunk
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._length)
+            if step == 1:
+                return self.page(start, stop - start)
+
+            return list(self)[index]
+
+        index = self._normalize(index)
+
+        if index == 0:
+            return self._chunks[0][0]
+        if index == self._length - 1:
+            return self._chunks[-1][-1]
+
+        chunk_index, position = self._locate(index)
+
+        return self._chunks[chunk_index][position]
+
+    def page(self, start: int, size: int) -> list[T]:
+        """
+        Returns up to **size** entries, starting at position **start**.
+        """
+        if size <= 0 or start >= self._length:
+            return []
+
+        chunk_index, position = self._locate(max(start, 0))
+        entries = []
+
+        while chunk_index < len(self._chunks) and len(entries) < size:
+            chunk = self._chunks[chunk_index]
+            entries.extend(chunk[i] for i in range(position, min(len(chunk), position + size - len(entries))))
+            chunk_index += 1
+            position = 0
+
+        return entries
+
+    def append(self, item: T):
+        if not self._chunks or len(self._chunks[-1]) >= self.chunk_size:
+            self._chunks.append(deque())
+            self._invalidate()
+
+        self._chunks[-1].append(item)
+        self._length += 1
+        self._tree_add(len(self._chunks) - 1, 1)
+        self.version += 1
+
+    def extend(self, items: Iterable[T]):
+        for item in items:
+            self.append(item)
+
+    def advance(self) -> T:
+        """
+        Removes and returns the head of the queue.
+        """
+        if not self._length:
+            raise IndexError("advance from an empty queue")
+
+        first = self._chunks[0]
+        item = first.popleft()
+        self._length -= 1
+
+        if not first:
+            del self._chunks[0]
+            self._invalidate()
+        elif self._tree is not None:
+            self._offset += 1
+
+        self.version += 1
+
+        return item
+
+    def _pop(self, index: int) -> T:
+        index = self._normalize(index)
+        if index == 0:
+            return self.advance()
+
+        chunk_index, position = self._locate(index)
+        chunk = self._chunks[chunk_index]
+
+        item = chunk[position]
+        del chunk[position]
+        self._length -= 1
+
+        if chunk:
+            self._tree_add(chunk_index, -1)
+        else:
+            del self._chunks[chunk_index]
+            self._invalidate()
+
+        return item
+
+    def _insert(self, index: int, item: T):
+        if index < 0:
+            index = max(index + self._length, 0)
+
+        if index >= self._length:
+            self.append(item)
+            return
+
+        chunk_index, position = self._locate(index)
+        chunk = self._chunks[chunk_index]
+
+        chunk.insert(position, item)
+        self._length += 1
+        self._tree_add(chunk_index, 1)
+
+        if len(chunk) > 2 * self.chunk_size:
+            self._chunks.insert(chunk_index + 1, deque(chunk[i] for i in range(self.chunk_size, len(chunk))))
+            for _ in range(len(chunk) - self.chunk_size):
+                chunk.pop()
+            self._invalidate()
+
+    def pop(self, index: int = -1) -> T:
+        item = self._pop(index)
+        self.version += 1
+
+        return item
+
+    def insert(self, index: int, item: T):
+        self._insert(index, item)
+        self.version += 1
+
+    def move(self, source: int, destination: int):
+        """
+        Moves the entry at position **source** to position **destination**.
+        """
+        self._insert(destination, self._pop(source))
+        self.version += 1
+
+    def clear(self):
+        self._chunks.clear()
+        self._length = 0
+        self._invalidate()
+        self.version += 1
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import atexit
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import pathlib
+import queue
+from logging.config import dictConfig
+
+# This module is imported by settings, so it must not import settings itself
+
+# The attributes every LogRecord has, anything else was passed through **extra** and ends up in the JSON lines
+_record_attributes = frozenset(logging.makeLogRecord({}).__dict__) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats the records as compact JSON lines: the time, the level, the logger, the module and the message,
+    along with the traceback (**exc_info**), the stack (**stack_info**) and the **extra** fields when there are
+    some.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(
+                timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "message": record.getMessage()
+        }
+
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+
+        if record.stack_info:
+            entry["stack_info"] = self.formatStack(record.stack_info)
+
+        entry.update((key, value) for key, value in record.__dict__.items()
+                     if key not in _record_attributes)
+
+        return json.dumps(entry, separators=(",", ":"), default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Queues the records for a listener of the same process.
+
+    The default **prepare** formats the traceback into the message and drops **exc_info**, so the handlers
+    behind the queue could not format it their own way. The record never leaves the process, it is only copied
+    with its message merged, so the arguments can change after the call without changing the record.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+
+        return record
+
+
+def file_handler(filename: str, level: str, formatter: str, rotation: str | None = None,
+                 max_bytes: int = 10 * 1024 ** 2, when: str = "midnight", backup_count: int = 5) -> dict:
+    """
+    Builds the dictConfig entry of a log file handler.
+
+    Args:
+        filename:   :class:`str`: The path of the log file.
+        level:  :class:`str`: The lowest level written to the file.
+        formatter:  :class:`str`: The name of the formatter.
+        rotation:   :class:`str`: **size** to rotate the file at **max_bytes**, **time** to rotate it at **when**,
+        None to truncate it at startup and keep a single file.
+        max_bytes:  :class:`int`: The size of a file before it is rotated.
+        when:   :class:`str`: The rotation interval of **logging.handlers.TimedRotatingFileHandler**.
+        backup_count:   :class:`int`: The number of rotated files that are kept.
+
+    Returns:
+        dict: The handler entry.
+
+    """
+    handler = {"level": level, "filename": filename, "formatter": formatter, "encoding": "utf-8"}
+
+    if rotation is None:
+        handler.update({"class": "logging.FileHandler", "mode": "w"})
+    elif rotation == "size":
+        handler.update({"class": "logging.handlers.RotatingFileHandler", "maxBytes": max_bytes,
+                        "backupCount": backup_count})
+    elif rotation == "time":
+        handler.update({"class": "logging.handlers.TimedRotatingFileHandler", "when": when,
+                        "backupCount": backup_count})
+    else:
+        raise ValueError(f"Unknown log rotation {rotation}")
+
+    return handler
+
+
+def configure(config: dict, queued: bool = False) -> list[logging.handlers.QueueListener]:
+    """
+    Applies a dictConfig logging configuration, with the handlers optionally moved off the calling thread.
+
+    In queued mode, every configured logger gets a single queue handler instead of its
+    handlers, which are run by a :class:`logging.handlers.QueueListener` thread. Logging a record then only
+    formats its message and puts it in a queue, the event loop never waits on the console or the disk.
+    The listeners are stopped, and their queues flushed, when the interpreter exits.
+
+    Args:
+        config: :class:`dict`: The dictConfig configuration.
+        queued: :class:`bool`: Whether the handlers run on listener threads.
+
+    Returns:
+        list[logging.handlers.QueueListener]: The listeners started, one per logger with handlers.
+
+    """
+    # The file handlers open their file right away, a fresh checkout has no logs directory yet
+    for handler in config.get("handlers", {}).values():
+        if "filename" in handler:
+            pathlib.Path(handler["filename"]).parent.mkdir(parents=True, exist_ok=True)
+
+    dictConfig(config)
+
+    if not queued:
+        return []
+
+    listeners = []
+    loggers = [logging.getLogger(name) for name in config.get("loggers", {})]
+    if "root" in config:
+        loggers.append(logging.getLogger())
+
+    for logger in loggers:
+        if not logger.handlers:
+            continue
+
+        records = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(records, *logger.handlers, respect_handler_level=True)
+        logger.handlers = [_QueueHandler(records)]
+
+        listener.start()
+        atexit.register(listener.stop)
+        listeners.append(listener)
+
+    return listeners
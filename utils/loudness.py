@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import re
+import shlex
+
+import settings
+from utils import metadata_cache as metadata_cache_utils
+
+logger = settings.logging.getLogger("bot")
+
+loudnorm_pattern = re.compile(r"\{[^{}]*\"input_i\"[^{}]*\}")
+
+
+def gain_for(loudness: float, target: float, max_gain: float) -> float:
+    """
+    Returns the linear gain bringing a track of the given integrated loudness to the target loudness.
+
+    Args:
+        loudness:   :class:`float`: The measured integrated loudness, in LUFS.
+        target: :class:`float`: The target integrated loudness, in LUFS.
+        max_gain:   :class:`float`: The highest gain applied to quiet tracks.
+
+    Returns:
+        float: The gain, as a float percentage (1.0 keeps the track as it is).
+
+    """
+    return min(10 ** ((target - loudness) / 20), max_gain)
+
+
+def gain_db(gain: float) -> float:
+    return 20 * math.log10(gain) if gain > 0 else -math.inf
+
+
+class LoudnessAnalyzer:
+    """
+    Measures the integrated loudness of the tracks once, in the background, and stores it with their metadata.
+
+    The measure is the first pass of ffmpeg's **loudnorm** filter, the playback then only applies a static gain.
+
+    Attributes:
+        metadata_cache: :class:`metadata_cache_utils.MetadataCache`: The store the measures are saved in.
+
+        timeout:    :class:`float`: The maximum duration of one analysis, in seconds.
+
+        max_pending:    :class:`int`: The number of tracks that can be analyzed or waiting at the same time, the
+        tracks played beyond it are skipped and measured another time they are played.
+
+    """
+
+    def __init__(self, metadata_cache: metadata_cache_utils.MetadataCache, concurrency: int = 1,
+                 timeout: float = 120.0, max_pending: int = 8):
+        self.metadata_cache = metadata_cache
+        self.timeout = timeout
+        self.max_pending = max_pending
+
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._pending: set[str] = set()
+
+    async def measure(self, location: str, before_options: str = "", window: float | None = None) -> float | None:
+        """
+        Runs the loudnorm analysis pass on a file or a stream.
+
+        Args:
+            location:   :class:`str`: The path or URL of the audio.
+            before_options: :class:`str`: The ffmpeg options placed before the input.
+            window: :class:`float`: The number of seconds measured from the start, None to measure everything.
+            ffmpeg stops reading the input once they are decoded.
+
+        Returns:
+            float | None: The integrated loudness in LUFS, or None if it could not be measured.
+
+        """
+        limit = ["-t", str(window)] if window is not None else []
+
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-hide_banner", "-nostats", *shlex.split(before_options), "-i", location, "-vn", *limit,
+            "-af", "loudnorm=print_format=json", "-f", "null", "-",
+            stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+
+        try:
+            _, stderr = await asyncio.wait_for(process.communicate(), self.timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            return None
+
+        match = loudnorm_pattern.search(stderr.decode(errors="replace"))
+        if match is None:
+            return None
+
+        loudness = float(json.loads(match.group(0))["input_i"])
+
+        return loudness if math.isfinite(loudness) else None
+
+    async def analyze(self, video_id: str, location: str, before_options: str = "", loop=None,
+                      window: float | None = None):
+        """
+        Measures a track, or its first **window** seconds, and stores the result, unless it is already being
+        measured or too many tracks are.
+        """
+        if video_id in self._pending or len(self._pending) >= self.max_pending:
+            return
+
+        loop = loop or asyncio.get_event_loop()
+        self._pending.add(video_id)
+
+        try:
+            async with self._semaphore:
+                loudness = await self.measure(location, before_options, window)
+
+            if loudness is not None:
+                await loop.run_in_executor(None, self.metadata_cache.set_loudness, video_id, loudness)
+        except Exception as error:
+            logger.warning(f"Could not measure the loudness of {video_id}: {error}")
+        finally:
+            self._pending.discard(video_id)
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import pathlib
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+# Stream URLs are dropped a bit before they really expire, so ffmpeg never starts on a dying link
+STREAM_EXPIRY_MARGIN = 10 * 60
+DEFAULT_STREAM_LIFETIME = 60 * 60
+
+metadata_fields = ("title", "duration", "duration_seconds", "thumbnail", "likes", "views",
+                   "date", "channel", "channel_url")
+
+# Columns added after the table was first created, they are added to existing databases when connecting
+added_columns = {
+    "stream_codec": "TEXT",
+    "plays": "INTEGER NOT NULL DEFAULT 0",
+    "loudness": "REAL"
+}
+
+
+def stream_expiry(stream_url: str) -> float:
+    """
+    Reads the expiry timestamp of a stream URL.
+
+    Googlevideo URLs carry an **expire** query parameter, other URLs get a default lifetime.
+
+    Args:
+        stream_url: :class:`str`: The direct media URL returned by the extractor.
+
+    Returns:
+        float: The UNIX timestamp after which the URL should not be used anymore.
+
+    """
+    query = urllib.parse.parse_qs(urllib.parse.urlsplit(stream_url).query)
+
+    try:
+        return float(query["expire"][0]) - STREAM_EXPIRY_MARGIN
+    except (KeyError, IndexError, ValueError):
+        return time.time() + DEFAULT_STREAM_LIFETIME
+
+
+class MetadataCache:
+    """
+    A persistent, SQLite backed store of the track metadata, keyed by video id.
+
+    The connection is shared between the executor threads and guarded by a lock, every method is blocking
+    and is meant to be run in an executor.
+
+    Attributes:
+        path:   :class:`pathlib.Path`: The location of the database file.
+
+    """
+
+    def __init__(self, path: str | pathlib.Path):
+        self.path = pathlib.Path(path)
+
+        self._lock = threading.Lock()
+        self._connection: sqlite3.Connection | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.row_factory = sqlite3.Row
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS tracks ("
+                "video_id TEXT PRIMARY KEY, title TEXT, duration TEXT, "
+                "duration_seconds INTEGER, thumbnail TEXT, likes INTEGER, views INTEGER, date TEXT, "
+                "channel TEXT, channel_url TEXT, stream_url TEXT, stream_expires REAL, updated REAL)")
+
+            columns = {row["name"] for row in self._connection.execute("PRAGMA table_info(tracks)")}
+            for column, column_type in added_columns.items():
+                if column not in columns:
+                    self._connection.execute(f"ALTER TABLE tracks ADD COLUMN {column} {column_type}")
+
+        return self._connection
+
+    def get(self, video_id: str) -> dict | None:
+        """
+        Returns the cached metadata of a video.
+
+        The stream URL and its codec are only returned if the URL is still valid, otherwise they are set to **None**.
+
+        Args:
+            video_id:   :class:`str`: The id of the video.
+
+        Returns:
+            dict | None: The cached fields or None if the video was never stored.
+
+        """
+        with self._lock:
+            row = self._connect().execute("SELECT * FROM tracks WHERE video_id = ?", (video_id,)).fetchone()
+
+        if row is None:
+            return None
+
+        record = dict(row)
+        if record["stream_expires"] is None or record["stream_expires"] < time.time():
+            record["stream_url"] = None
+            record["stream_codec"] = None
+
+        return record
+
+    def put(self, video_id: str, metadata: dict, stream_url: str | None = None, stream_codec: str | None = None):
+        """
+        Stores or refreshes the metadata of a video.
+
+        Args:
+            video_id:   :class:`str`: The id of the video.
+            metadata:   :class:`dict`: The fields listed in **metadata_fields**.
+            stream_url: :class:`str`: The direct media URL, if one was extracted.
+            stream_codec:   :class:`str`: The audio codec of the stream.
+
+        """
+        expires = stream_expiry(stream_url) if stream_url else None
+        values = [metadata.get(field) for field in metadata_fields]
+
+        with self._lock:
+            connection = self._connect()
+            columns = (*metadata_fields, "stream_url", "stream_codec", "stream_expires", "updated")
+            # An upsert, so the columns that are not part of the metadata (the play count...) are kept
+            connection.execute(
+                f"INSERT INTO tracks (video_id, {', '.join(columns)}) VALUES ({', '.join('?' * (len(columns) + 1))}) "
+                f"ON CONFLICT(video_id) DO UPDATE SET "
+                f"{', '.join(f'{column} = excluded.{column}' for column in columns)}",
+                (video_id, *values, stream_url, stream_codec, expires, time.time()))
+            connection.commit()
+
+    def update_stream(self, video_id: str, stream_url: str, stream_codec: str | None = None):
+        with self._lock:
+            connection = self._connect()
+            connection.execute("UPDATE tracks SET stream_url = ?, stream_codec = ?, stream_expires = ? "
+                               "WHERE video_id = ?",
+                               (stream_url, stream_codec, stream_expiry(stream_url), video_id))
+            connection.commit()
+
+    def set_loudness(self, video_id: str, loudness: float):
+        with self._lock:
+            connection = self._connect()
+            connection.execute("UPDATE tracks SET loudness = ? WHERE video_id = ?", (loudness, video_id))
+            connection.commit()
+
+    def record_play(self, video_id: str) -> int:
+        """
+        Increments the play count of a video and returns the new count (0 if the video is not stored).
+        """
+        with self._lock:
+            connection = self._connect()
+            connection.execute("UPDATE tracks SET plays = plays + 1 WHERE video_id = ?", (video_id,))
+            connection.commit()
+            row = connection.execute("SELECT plays FROM tracks WHERE video_id = ?", (video_id,)).fetchone()
+
+        return row["plays"] if row is not None else 0
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
@@ -0,0 +1,323 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import math
+import threading
+import time
+from typing import Callable
+
+from aiohttp import web
+
+import settings
+
+logger = settings.logging.getLogger("bot")
+
+# Latency buckets, in seconds, from a cached lookup to a slow extraction
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    labels = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+
+    return repr(float(value))
+
+
+class Metric:
+    """
+    The base of the metric types, a family of samples sharing a name and a set of label names.
+
+    The samples are updated from the event loop and from the audio threads, they are guarded by a lock.
+
+    Attributes:
+        name:   :class:`str`: The name of the metric, as exposed to Prometheus.
+
+        description:    :class:`str`: The help text of the metric.
+
+        labels: :class:`tuple[str]`: The names of the labels.
+
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        return "\n".join((f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}",
+                          *self.samples()))
+
+
+class Counter(Metric):
+    """A value that only goes up"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, description, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in values]
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down.
+
+    Instead of being set, a gauge can be computed when the metrics are scraped, by a function returning either a
+    single value or a dict of label values to values.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = (),
+                 function: Callable[[], float | dict[tuple, float]] | None = None):
+        super().__init__(name, description, labels)
+        self.function = function
+        self._values: dict[tuple, float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self) -> list[str]:
+        if self.function is not None:
+            values = self.function()
+            values = values.items() if isinstance(values, dict) else [((), values)]
+        else:
+            with self._lock:
+                values = list(self._values.items())
+
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in values]
+
+
+class Histogram(Metric):
+    """
+    Counts the observed values in cumulative buckets, along with their sum and count.
+
+    Attributes:
+        buckets:    :class:`tuple[float]`: The upper bounds of the buckets, **+Inf** is always added.
+
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+        # Per label values: the count of every bucket (not cumulative), the sum and the count
+        self._values: dict[tuple, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            counts, totals = self._values.setdefault(key, ([0] * len(self.buckets), [0.0, 0]))
+            counts[index] += 1
+            totals[0] += value
+            totals[1] += 1
+
+    def time(self, **labels) -> Timer:
+        """Returns a context manager observing the duration of its block"""
+
+        return Timer(self, labels)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = [(key, list(counts), list(totals)) for key, (counts, totals) in self._values.items()]
+
+        lines = []
+        for key, counts, (total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+
+        return lines
+
+
+class Timer:
+    """Observes the duration of a **with** block into a histogram"""
+
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+        self._start = 0.0
+
+    def __enter__(self) -> Timer:
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.histogram.observe(time.perf_counter() - self._start, **self.labels)
+
+
+class Registry:
+    """
+    Holds the metrics and renders them in the Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"A metric named {metric.name} is already registered")
+
+        self._metrics[metric.name] = metric
+
+        return metric
+
+    def counter(self, name: str, description: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, description, labels))
+
+    def gauge(self, name: str, description: str, labels: tuple[str, ...] = (),
+              function: Callable[[], float | dict[tuple, float]] | None = None) -> Gauge:
+        return self.register(Gauge(name, description, labels, function))
+
+    def histogram(self, name: str, description: str, labels: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, description, labels, buckets))
+
+    def get(self, name: str) -> Metric | None:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        blocks = []
+
+        for metric in self._metrics.values():
+            try:
+                blocks.append(metric.render())
+            except Exception as error:
+                logger.warning(f"Could not collect the metric {metric.name}: {error}")
+
+        return "\n".join(blocks) + "\n"
+
+
+registry = Registry()
+
+search_seconds = registry.histogram("jacko_search_seconds", "Time to resolve a search query to a video",
+                                    labels=("result",))
+extraction_seconds = registry.histogram("jacko_extraction_seconds", "Time to fetch the metadata of a video",
+                                        labels=("source",))
+ffmpeg_startup_seconds = registry.histogram("jacko_ffmpeg_startup_seconds",
+                                            "Time between spawning ffmpeg and its first audio frame")
+play_seconds = registry.histogram("jacko_play_seconds",
+                                  "Time between a !play command and the reply announcing the song")
+track_gap_seconds = registry.histogram("jacko_track_gap_seconds",
+                                       "Time between the end of a track and the start of the next one")
+event_loop_lag_seconds = registry.histogram("jacko_event_loop_lag_seconds",
+                                            "Delay of the event loop in waking up a sleeping task",
+                                            buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+playback_failures = registry.counter("jacko_playback_failures_total", "Songs that could not be started")
+
+# Computed when scraped, their functions are set by the modules owning the state
+queue_depth = registry.gauge("jacko_queue_depth", "Number of songs in the queue of a guild", labels=("guild",))
+players = registry.gauge("jacko_players", "Number of live music players")
+players_evicted = registry.gauge("jacko_players_evicted", "Number of players evicted since the start")
+ffmpeg_processes = registry.gauge("jacko_ffmpeg_processes", "Number of running ffmpeg processes")
+
+startup_seconds = registry.gauge("jacko_startup_seconds",
+                                 "Time between the start of the bot and its first ready event")
+
+
+async def monitor_event_loop(interval: float = 1.0):
+    """
+    Measures the event loop lag forever, as the delay of waking up from a sleep of **interval** seconds.
+    """
+    loop = asyncio.get_running_loop()
+
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        event_loop_lag_seconds.observe(max(0.0, loop.time() - start - interval))
+
+
+class MetricsServer:
+    """
+    Serves the metrics of a registry over HTTP, on **/metrics**.
+
+    Attributes:
+        registry:   :class:`Registry`: The metrics being served.
+
+        host:   :class:`str`: The address the server listens on, local only by default.
+
+        port:   :class:`int`: The port the server listens on.
+
+    """
+
+    def __init__(self, registry: Registry, host: str = "127.0.0.1", port: int = 9464):
+        self.registry = registry
+        self.host = host
+        self.port = port
+
+        self._runner: web.AppRunner | None = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(body=self.registry.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+        logger.info(f"Serving the metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -1,7 +1,13 @@
 from __future__ import annotations
 
+import time
+from collections import OrderedDict
 from typing import List
 
+import settings
+from utils import guild_queue
+from utils import metrics
+from utils import session_store as session_store_utils
 from utils import ytdl_utils
 
 import asyncio
@@ -10,6 +16,8 @@ import datetime
 import discord
 from discord.ext import commands
 
+logger = settings.logging.getLogger("bot")
+
 
 class NotConnectedToVoice(Exception):
     """Cannot create the player because the bot is not connected to voice"""
@@ -23,114 +31,532 @@ class EmptyQueue(Exception):
     """The queue is empty"""
 
 
+def track_of(song: ytdl_utils.Song) -> tuple:
+    """Returns the checkpointed fields of a song, in the order of **session_store_utils.track_fields**"""
+
+    return (song.video_id, song.url, song.title, song.duration_seconds,
+            song.requester.id if song.requester is not None else None)
+
+
 class PlayerHandler:
-    def __init__(self):
-        self.queue: dict[discord.ext.commands.Context.guild, list[ytdl_utils.YTDLSource]] = {}
-        self.players: dict[discord.ext.commands.Context.guild, MusicPlayer] = {}
+    """
+    Keeps the player and the queue of every guild, and evicts the players that are not needed anymore.
+
+    The players are kept in the order of their last activity, so a sweep only looks at the players that have
+    been idle for longer than **idle_timeout**, however many guilds the bot is in. Players whose voice client
+    is gone are reaped as soon as they are looked up.
+
+    With a **store**, the queues and the position in the current songs are checkpointed as they change, and a
+    player can be restored from its checkpoint after a reload of the cog or a restart of the bot.
+
+    Attributes:
+        idle_timeout:   :class:`float`: The number of seconds a player can stay idle before it is disconnected.
+
+        evicted:    :class:`int`: The number of players evicted since the start.
+
+        store:  :class:`session_store_utils.SessionStore`: Where the sessions are checkpointed, None to keep
+        them in memory only.
+
+    """
+
+    def __init__(self, idle_timeout: float = settings.PLAYER_IDLE_TIMEOUT,
+                 store: session_store_utils.SessionStore | None = None):
+        self.queue: dict[int, guild_queue.GuildQueue[ytdl_utils.Song]] = {}
+        self.players: dict[int, MusicPlayer] = {}
+
+        self.idle_timeout = idle_timeout
+        self.evicted = 0
+        self.store = store
+
+        # Guild ids ordered from the least to the most recently active player
+        self._activity: OrderedDict[int, float] = OrderedDict()
+
+        metrics.queue_depth.function = lambda: {(guild_id,): len(queue) for guild_id, queue in self.queue.items()}
+        metrics.players.function = lambda: self.live
+        metrics.players_evicted.function = lambda: self.evicted
+
+    @property
+    def live(self) -> int:
+        return len(self.players)
 
     def create_player(self, ctx: discord.ext.commands.Context, **kwargs) -> MusicPlayer:
         if not ctx.voice_client:
             raise NotConnectedToVoice("Cannot create the player because the bot is not connected to voice")
 
-        player = MusicPlayer(ctx, self, **kwargs)
-        self.players[ctx.guild] = player
+        return self._create(ctx.bot, ctx.guild.id, ctx.voice_client.channel.id, **kwargs)
+
+    def _create(self, bot: commands.Bot, guild_id: int, channel_id: int, **kwargs) -> MusicPlayer:
+        player = MusicPlayer(bot, guild_id, self, **kwargs)
+        self.players[guild_id] = player
+        self.touch(guild_id)
+
+        if self.store is not None:
+            self.store.submit(self.store.set_channel, guild_id, channel_id)
 
         return player
 
     def get_player(self, ctx: discord.ext.commands.Context) -> MusicPlayer | None:
-        if ctx.guild not in self.players:
+        player = self.players.get(ctx.guild.id)
+        if player is None:
+            return None
+
+        if player.voice is None:
+            self._discard(ctx.guild.id)
             return None
 
-        return self.players[ctx.guild]
+        return player
+
+    def touch(self, guild_id: int):
+        """Marks the player of the guild as active"""
+
+        self._activity[guild_id] = time.monotonic()
+        self._activity.move_to_end(guild_id)
+
+    def _discard(self, guild_id: int) -> MusicPlayer | None:
+        player = self.players.pop(guild_id, None)
+        self.queue.pop(guild_id, None)
+        self._activity.pop(guild_id, None)
+
+        if player is not None:
+            player.close()
+            self.evicted += 1
+
+        if self.store is not None:
+            self.store.submit(self.store.delete, guild_id)
+
+        return player
+
+    async def evict(self, guild_id: int, disconnect: bool = True):
+        """
+        Stops and forgets the player of a guild, disconnecting it from voice if needed.
+        """
+        player = self._discard(guild_id)
+
+        if player is not None and disconnect and player.voice is not None:
+            await player.voice.disconnect()
+
+    async def sweep(self):
+        """
+        Evicts the players that have been idle for too long, and the ones whose voice client is gone.
+
+        Only the players whose last activity is older than **idle_timeout** are looked at. The ones that are
+        still playing, or paused, are marked as active again, so they are not looked at before another timeout.
+        """
+        deadline = time.monotonic() - self.idle_timeout
+
+        while self._activity:
+            guild_id, last_active = next(iter(self._activity.items()))
+            if last_active > deadline:
+                break
+
+            player = self.players.get(guild_id)
+            # A paused song would lose its whole queue, and its saved session, if it counted as idle
+            if player is not None and player.voice is not None and \
+                    (player.voice.is_playing() or player.voice.is_paused()):
+                self.touch(guild_id)
+                continue
+
+            await self.evict(guild_id)
+
+    def checkpoint(self):
+        """Saves the position in the current song of every player that is playing or paused"""
+
+        if self.store is None:
+            return
+
+        # The position of a paused song does not move, the time spent paused is left out of it
+        offsets = [(guild_id, player.elapsed()) for guild_id, player in self.players.items()
+                   if player.voice is not None and (player.voice.is_playing() or player.voice.is_paused())]
+        if offsets:
+            self.store.submit(self.store.set_offsets, offsets)
+
+    def suspend(self):
+        """
+        Checkpoints and stops every player, without forgetting their sessions or leaving the voice channels.
+
+        Used when the cog is unloaded, the players are restored by the next instance of the cog.
+        """
+        self.checkpoint()
+
+        players = list(self.players.values())
+        self.players.clear()
+        self.queue.clear()
+        self._activity.clear()
+
+        for player in players:
+            player.close()
+
+    async def restore(self, bot: commands.Bot, guild: discord.Guild, **kwargs) -> MusicPlayer | None:
+        """
+        Rebuilds the player of a guild from its checkpoint and resumes the playback where it stopped.
+
+        The songs are restored as partial songs, their metadata is only looked up once they reach the head of
+        the queue. The bot joins the saved voice channel again if it is not connected anymore.
+
+        Args:
+            bot:    :class:`commands.Bot`: The bot instance.
+            guild:  :class:`discord.Guild`: The guild to restore.
+
+        Returns:
+            MusicPlayer | None: The restored player, or None if the guild had no session to restore.
+
+        """
+        if self.store is None or guild.id in self.players:
+            return self.players.get(guild.id)
+
+        session, tracks = await self.store.run(self.store.load, guild.id)
+        if session is None:
+            return None
+
+        voice = guild.voice_client
+        channel = guild.get_channel(session["channel_id"]) if session["channel_id"] is not None else None
+
+        tracks = [track for track in tracks if track["video_id"]]
+        if not tracks or (voice is None and channel is None):
+            self.store.submit(self.store.delete, guild.id)
+            return None
+
+        if voice is None:
+            voice = await channel.connect()
+
+        player = self._create(bot, guild.id, voice.channel.id, **kwargs)
+        self.queue[guild.id].extend(
+            ytdl_utils.song_from_entry({"id": track["video_id"], "title": track["title"],
+                                        "duration": track["duration_seconds"]},
+                                       requester=guild.get_member(track["requester_id"])
+                                       if track["requester_id"] is not None else None)
+            for track in tracks)
+
+        # The songs that cannot be resumed are dropped, the next one that can is played from its start
+        await player.play(offset=session["elapsed"])
+
+        logger.info(f"Restored the session of {guild.id} with {len(tracks)} songs")
+
+        return player
 
 
 class MusicPlayer:
-    def __init__(self, ctx: discord.ext.commands.Context, handler: PlayerHandler, **kwargs):
-        self.ctx = ctx
-        self.voice = ctx.voice_client
-        self.guild = ctx.guild
+    def __init__(self, bot: commands.Bot, guild_id: int, handler: PlayerHandler, **kwargs):
+        # Neither the context nor the voice client are kept, they would outlive the voice session
+        self.bot = bot
+        self.guild = guild_id
         self.ffmpeg_options = kwargs.get("ffmpeg_options")
         self.handler = handler
+        self.source: discord.AudioSource | None = None
+        # Set while the source of a song is being created, the voice client is not playing yet
+        self._starting = False
+        # When the current song was paused, None while it plays
+        self._paused_at: datetime.datetime | None = None
+
+        self.prefetch_seconds = kwargs.get("prefetch_seconds", settings.PREFETCH_SECONDS)
+        self._prefetch_task: asyncio.Task | None = None
+        self._prepared: tuple[ytdl_utils.Song, discord.AudioSource] | None = None
 
         if self.guild not in self.handler.queue:
-            self.handler.queue[self.guild]: list[ytdl_utils.YTDLSource] = []
+            self.handler.queue[self.guild] = guild_queue.GuildQueue()
+
+    @property
+    def voice(self) -> discord.VoiceClient | None:
+        """The current voice client of the guild, None if the bot is not connected anymore"""
+
+        guild = self.bot.get_guild(self.guild)
+
+        return guild.voice_client if guild is not None else None
+
+    def is_idle(self) -> bool:
+        """
+        Whether the player has nothing to play, a paused song or a song being started do not count as idle.
+
+        The commands check this instead of the voice client, which does not play anything while the next song
+        is being started.
+        """
+        return self.source is None and not self._starting
+
+    def elapsed(self) -> float:
+        """The number of seconds played of the current song, the time spent paused does not count"""
+
+        queue = self.handler.queue.get(self.guild)
+        if not queue or queue[0].start_time is None:
+            return 0.0
+
+        # The start time is shifted by the length of every pause once it ends
+        now = self._paused_at or datetime.datetime.now()
+
+        return max(0.0, (now - queue[0].start_time).total_seconds())
+
+    def _persist(self, method: str, *args):
+        """Queues a change of the queue on the session store, if the sessions are persisted"""
+
+        store = self.handler.store
+        if store is not None:
+            store.submit(getattr(store, method), self.guild, *args)
+
+    def _persist_queue(self):
+        """Rewrites the whole checkpointed queue, after a change in its middle"""
+
+        if self.handler.store is not None:
+            self._persist("replace", [track_of(song) for song in self.handler.queue[self.guild]])
+
+    def close(self):
+        """Stops the playback and releases the audio sources and the background tasks of the player"""
+
+        if self._prefetch_task is not None:
+            self._prefetch_task.cancel()
+            self._prefetch_task = None
+
+        self._discard_prepared()
+
+        if self.voice is not None:
+            self.voice.stop()
+        self.source = None
+        self._paused_at = None
+
+    async def _start(self, song: ytdl_utils.Song, offset: float = 0.0):
+        """
+        Creates the audio source of the song, spawning its ffmpeg process, and starts playing it **offset**
+        seconds in.
+        """
+        self._starting = True
 
-    async def _check_queue(self):
         try:
-            self.handler.queue[self.guild].pop(0)
-        except IndexError:
-            raise EmptyQueue
+            if self._prepared is not None and self._prepared[0] is song and not offset:
+                source = self._prepared[1]
+                self._prepared = None
+            else:
+                self._discard_prepared()
+                source = await ytdl_utils.YTDLSource.from_song(song, self.bot.loop, offset=offset)
+
+            try:
+                self.voice.play(source,
+                                after=lambda e: asyncio.run_coroutine_threadsafe(
+                                    self._check_queue(source),
+                                    self.bot.loop
+                                ) if not e else e)
+            except Exception:
+                # The voice client is gone or busy, the source would leak its ffmpeg process and read-ahead thread
+                source.cleanup()
+                raise
+
+            self.source = source
+        finally:
+            self._starting = False
+
+        song.start_time = datetime.datetime.now() - datetime.timedelta(seconds=offset)
+        self._paused_at = None
+        self.handler.touch(self.guild)
+
+        if ytdl_utils.audio_cache is not None and song.video_id:
+            self.bot.loop.create_task(ytdl_utils.audio_cache.record_play(song.video_id, song.url,
+                                                                            self.bot.loop))
+        self.bot.loop.create_task(ytdl_utils.analyze_loudness(song, self.bot.loop))
+
+        self._schedule_prefetch()
+
+    def _schedule_prefetch(self):
+        """(Re)schedules the preparation of the next song, relative to the end of the current one"""
+
+        if self._prefetch_task is not None:
+            self._prefetch_task.cancel()
+
+        self._prefetch_task = self.bot.loop.create_task(self._prefetch())
+
+    async def _prefetch(self):
+        """
+        Prepares the next song a few seconds before the current one ends.
+
+        The stream URL is resolved and the ffmpeg process is spawned ahead of time, so it has already buffered
+        the beginning of the track when **_check_queue** promotes it.
+        """
+        queue = self.handler.queue[self.guild]
+        if not queue or not queue[0].duration_seconds:
+            return
 
+        current = queue[0]
+        await asyncio.sleep(max(0.0, current.duration_seconds - self.elapsed() - self.prefetch_seconds))
+
+        if len(queue) < 2 or queue[0] is not current:
+            return
+
+        upcoming = queue[1]
+        if self._prepared is not None and self._prepared[0] is upcoming:
+            return
+
+        self._discard_prepared()
         try:
-            source = self.handler.queue[self.guild][0]
-            source.song.start_time = datetime.datetime.now()
-            self.voice.play(source,
-                            after=lambda e: asyncio.run_coroutine_threadsafe(
-                                self._check_queue(),
-                                self.ctx.bot.loop
-                            ) if not e else e)
-        except IndexError:
+            source = await ytdl_utils.YTDLSource.from_song(upcoming, self.bot.loop)
+        except Exception as error:
+            logger.warning(f"Could not prefetch {upcoming.url}: {error}")
+            return
+
+        if len(queue) > 1 and queue[1] is upcoming:
+            self._prepared = (upcoming, source)
+        else:
+            source.cleanup()
+
+    def _discard_prepared(self):
+        if self._prepared is not None:
+            self._prepared[1].cleanup()
+            self._prepared = None
+
+    async def _check_queue(self, finished: discord.AudioSource | None = None):
+        # The player was evicted, its queue is gone with it
+        if self.handler.players.get(self.guild) is not self:
+            return
+
+        # The source was replaced or stopped on purpose since it ended, the queue was already taken care of
+        if self.source is not finished:
             return
 
-    async def play(self) -> ytdl_utils.Song:
-        source = self.handler.queue[self.guild][0]
+        ended = time.perf_counter()
+
+        try:
+            self.handler.queue[self.guild].advance()
+        except IndexError:
+            raise EmptyQueue
+
+        self._persist("advance")
+
+        self.source = None
+
+        if self._prefetch_task is not None:
+            self._prefetch_task.cancel()
+            self._prefetch_task = None
+
+        song, _ = await self._start_head()
+        if song is not None:
+            metrics.track_gap_seconds.observe(time.perf_counter() - ended)
+
+    async def _start_head(self, offset: float = 0.0) -> tuple[ytdl_utils.Song | None,
+                                                              list[tuple[ytdl_utils.Song, Exception]]]:
+        """
+        Starts the song at the head of the queue, dropping the songs that cannot be started until one does.
+
+        Only the first song is started **offset** seconds in. A failing song would otherwise stay at the head
+        of the queue with no source, and every later !play would try it again instead of playing.
+
+        Returns:
+            tuple: The song started (None if the queue ran out) and the songs dropped, with their error.
+
+        """
+        queue = self.handler.queue[self.guild]
+        skipped = []
+
+        while queue:
+            song = queue[0]
+
+            try:
+                await self._start(song, offset)
+                return song, skipped
+            except Exception as error:
+                metrics.playback_failures.inc()
+                logger.warning(f"Could not play {song.url}: {error}")
+                skipped.append((song, error))
 
-        self.voice.play(source,
-                        after=lambda e: asyncio.run_coroutine_threadsafe(
-                            self._check_queue(),
-                            self.ctx.bot.loop
-                        ) if not e else e)
+                queue.advance()
+                self._persist("advance")
+                offset = 0.0
 
-        return source.song
+        return None, skipped
+
+    async def play(self, offset: float = 0.0) -> tuple[ytdl_utils.Song | None,
+                                                        list[tuple[ytdl_utils.Song, Exception]]]:
+        """
+        Starts playing the queue, the songs that cannot be started are dropped like in **_check_queue**.
+
+        Args:
+            offset: :class:`float`: The position to start the first song at, in seconds.
+
+        Returns:
+            tuple: The song started (None if none could be) and the songs dropped, with their error.
+
+        """
+        return await self._start_head(offset)
 
     async def stop(self):
         try:
+            self.source = None
+            self._paused_at = None
             self.voice.stop()
             self.handler.queue[self.guild].clear()
+            self._discard_prepared()
+            self._persist("replace", [])
         except self.handler.queue[self.guild] == []:
             raise NotPlaying("Nothing is playing")
 
     async def resume(self) -> ytdl_utils.Song:
         try:
             self.voice.resume()
-            source = self.handler.queue[self.guild][0]
+            song = self.handler.queue[self.guild][0]
         except self.handler.queue[self.guild] == []:
             raise NotPlaying("Nothing is playing")
 
-        return source.song
+        # The song went on where it was paused, its start moves forward by the length of the pause
+        if self._paused_at is not None:
+            if song.start_time is not None:
+                song.start_time += datetime.datetime.now() - self._paused_at
+            self._paused_at = None
+
+            if self.source is not None:
+                self._schedule_prefetch()
+
+        return song
 
     async def pause(self) -> ytdl_utils.Song:
         try:
             self.voice.pause()
-            source = self.handler.queue[self.guild][0]
+            song = self.handler.queue[self.guild][0]
         except self.handler.queue[self.guild] == []:
             raise NotPlaying("Nothing is playing")
 
-        return source.song
+        if self._paused_at is None:
+            self._paused_at = datetime.datetime.now()
 
-    async def queue(self, url) -> ytdl_utils.Song:
-        source = await ytdl_utils.YTDLSource.fetch_video_data(url, self.ctx.bot.loop, requester=self.ctx.author)
-        self.handler.queue[self.guild].append(source)
+            # The next song is prepared relative to the end of this one, which is pushed back by the pause
+            if self._prefetch_task is not None:
+                self._prefetch_task.cancel()
+                self._prefetch_task = None
 
-        return source.song
+        return song
+
+    async def fetch(self, url, requester=None) -> ytdl_utils.Song:
+        return await ytdl_utils.YTDLSource.fetch_video_data(url, self.bot.loop,
+                                                            requester=requester)
+
+    def add(self, song: ytdl_utils.Song) -> ytdl_utils.Song:
+        self.handler.queue[self.guild].append(song)
+        self.handler.touch(self.guild)
+        self._persist("append", track_of(song))
+
+        if len(self.handler.queue[self.guild]) == 2 and self.source is not None:
+            self._schedule_prefetch()
+
+        return song
 
     async def skip(self) -> ytdl_utils.Song | None:
         if len(self.handler.queue[self.guild]) > 1:
             try:
                 self.voice.stop()
 
-                return self.handler.queue[self.guild][1].song
+                return self.handler.queue[self.guild][1]
             except IndexError:
                 return None
 
     async def remove(self, index=0) -> ytdl_utils.Song:
         try:
-            song = self.handler.queue[self.guild][index].song
+            song = self.handler.queue[self.guild][index]
         except IndexError:
             raise NotPlaying("Nothing is playing")
 
         if index == 0:
             await self.skip()
+            return song
+
+        self.handler.queue[self.guild].pop(index)
+        self._persist_queue()
+
+        if index == 1 and self.source is not None:
+            self._discard_prepared()
+            self._schedule_prefetch()
 
         return song
 
@@ -1,30 +1,326 @@
-import urllib.request
+from __future__ import annotations
+
+import asyncio
 import re
+import time
+import urllib.parse
+from collections import OrderedDict
+
+from typing import AsyncIterator, Awaitable, Callable, Iterable, TypeVar
+
+import aiohttp
+import discord
+
+import settings
+from utils import metrics
+
+logger = settings.logging.getLogger("bot")
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+YOUTUBE_URL = "https://www.youtube.com"
+
+video_id_pattern = re.compile(r'watch\?v=(\S{11})')
+punctuation_pattern = re.compile(r"[^\w\s]")
+
+
+class SongNotFound(Exception):
+    """The search did not return any video"""
+
+
+def is_playlist(url: str) -> bool:
+    """
+    Checks if a URL points to a whole playlist rather than to a single video.
+    """
+    if "https" not in url:
+        return False
 
+    query = urllib.parse.parse_qs(urllib.parse.urlsplit(url.strip()).query)
 
-def find_url(name):
+    return "list" in query and "v" not in query
+
+
+def normalize_query(query: str) -> str:
     """
-    Finds and returns a URL based on the provided name.
+    Normalizes a search query so small spelling differences map to the same key.
 
-    If the provided name is a URL, it will simply return it
+    The query is lowercased, the punctuation is dropped and the whitespace is collapsed.
 
     Args:
-        name:   :class:`str`: The name or URL to search for or use as-is.
+        query:  :class:`str`: The query to normalize.
 
     Returns:
-        str: The generated or provided URL.
-
-    """
-    if "https" not in name:
-        words_list = name.split()
-        full_name = ''
-        for i in range(0, len(words_list)):
-            full_name = full_name + words_list[i] + '+'
-        full_name = full_name[:-1]
-        name = full_name
-        html = urllib.request.urlopen('https://www.youtube.com/results?search_query=' + str(name))
-        video_ids = re.findall(r'watch\?v=(\S{11})', html.read().decode())
-        url = 'https://www.youtube.com/watch?v=' + str(video_ids[0])
-    else:
-        url = name
-    return url
+        str: The normalized query.
+
+    """
+    return " ".join(punctuation_pattern.sub("", query.casefold()).split())
+
+
+async def resolve_in_order(items: Iterable[T], resolve: Callable[[T], Awaitable[R]],
+                           limit: int = 4) -> AsyncIterator[tuple[T, R | None, Exception | None]]:
+    """
+    Resolves the items concurrently and yields the results in the order of the input.
+
+    At most **limit** items are resolved at the same time. Each result is yielded as soon as it and all the
+    results before it are ready, and a failing item is yielded with its error instead of aborting the batch.
+
+    Args:
+        items:  :class:`Iterable`: The items to resolve.
+        resolve:    :class:`function` --> The coroutine function resolving one item.
+        limit:  :class:`int`: The maximum number of items resolved at the same time.
+
+    Yields:
+        tuple: The item, its result (None on failure) and the error raised (None on success).
+
+    """
+    items = list(items)
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(item):
+        async with semaphore:
+            return await resolve(item)
+
+    tasks = [asyncio.ensure_future(run(item)) for item in items]
+
+    try:
+        for item, task in zip(items, tasks):
+            try:
+                yield item, await task, None
+            except Exception as error:
+                yield item, None, error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+class ProgressMessage:
+    """
+    A reply that is edited as a long command progresses, at most once every **interval** seconds.
+
+    The updates arriving in between only replace the pending embed, a single delayed edit shows the latest one.
+    A burst of updates then costs one message and a few edits, instead of a message each.
+
+    Attributes:
+        ctx:    :class:`discord.ext.commands.Context`: The context of the command being answered.
+
+        interval:   :class:`float`: The minimum time between two edits, in seconds.
+
+        message:    :class:`discord.Message`: The reply, None until the first update is sent.
+
+    """
+
+    def __init__(self, ctx, interval: float = 1.0):
+        self.ctx = ctx
+        self.interval = interval
+        self.message: discord.Message | None = None
+
+        self._pending: discord.Embed | None = None
+        self._last = 0.0
+        self._lock = asyncio.Lock()
+        self._delayed: asyncio.Task | None = None
+
+    async def update(self, embed: discord.Embed, now: bool = False):
+        """Shows **embed**, right away if **now** is set or if the last edit is old enough, later otherwise"""
+
+        self._pending = embed
+
+        if self.message is None or now or time.monotonic() - self._last >= self.interval:
+            await self._flush()
+        elif self._delayed is None:
+            self._delayed = asyncio.ensure_future(self._flush_later())
+
+    async def finish(self, embed: discord.Embed):
+        """Shows the final embed right away, the pending update is dropped"""
+
+        if self._delayed is not None:
+            self._delayed.cancel()
+            self._delayed = None
+
+        self._pending = embed
+        await self._flush()
+
+    async def _flush_later(self):
+        await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - self._last)))
+        self._delayed = None
+
+        # Nothing awaits this task, an error left in it would only surface as "Task exception was never retrieved"
+        try:
+            await self._flush()
+        except discord.HTTPException as error:
+            logger.warning(f"Could not update the progress message: {error}")
+
+    async def _flush(self):
+        async with self._lock:
+            embed, self._pending = self._pending, None
+            if embed is None:
+                return
+
+            self._last = time.monotonic()
+
+            if self.message is not None:
+                try:
+                    await self.message.edit(embed=embed)
+                    return
+                except discord.NotFound:
+                    # The reply was deleted, the progress goes on in a new one
+                    pass
+
+            self.message = await self.ctx.send(embed=embed)
+
+
+class QueryCache:
+    """
+    A size-bounded LRU cache with a TTL, mapping normalized search queries to video ids.
+
+    Attributes:
+        max_size:   :class:`int`: The maximum number of queries kept, the least recently used one is evicted first.
+
+        ttl:    :class:`float`: The number of seconds an entry is valid for.
+
+        hits:   :class:`int`: The number of lookups answered from the cache.
+
+        misses: :class:`int`: The number of lookups that were missing or expired.
+
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 6 * 60 * 60):
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    def get(self, query: str) -> str | None:
+        key = normalize_query(query)
+        entry = self._entries.get(key)
+
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+
+        return entry[1]
+
+    def put(self, query: str, video_id: str):
+        key = normalize_query(query)
+
+        self._entries[key] = (time.monotonic() + self.ttl, video_id)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SearchResolver:
+    """
+    Resolves song names to YouTube URLs without blocking the event loop.
+
+    All the searches share one pooled, keep-alive HTTP session and the number of searches in flight
+    is bounded, so a burst of requests cannot open an unbounded number of connections.
+
+    Attributes:
+        base_url:   :class:`str`: The site the results page is fetched from (can point to a local fake server).
+
+        timeout:    :class:`float`: The total timeout of one search, in seconds.
+
+        concurrency:    :class:`int`: The maximum number of searches running at the same time.
+
+        cache:  :class:`QueryCache`: The cache of already resolved queries.
+
+    """
+
+    def __init__(self, base_url: str = YOUTUBE_URL, timeout: float = 5.0, concurrency: int = 8,
+                 cache: QueryCache | None = None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.cache = cache if cache is not None else QueryCache()
+
+        self._session: aiohttp.ClientSession | None = None
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+        return self._session
+
+    async def search(self, name: str) -> str:
+        """
+        Searches the results page and returns the id of the first video.
+
+        Queries that were already resolved are answered from the cache, without any network round trip.
+
+        Args:
+            name:   :class:`str`: The keywords to search for.
+
+        Returns:
+            str: The id of the first video found.
+
+        """
+        started = time.perf_counter()
+
+        video_id = self.cache.get(name)
+        if video_id is not None:
+            metrics.search_seconds.observe(time.perf_counter() - started, result="cache")
+            return video_id
+
+        session = self._get_session()
+
+        async with self._semaphore:
+            async with session.get(f"{self.base_url}/results", params={"search_query": " ".join(name.split())}) \
+                    as response:
+                response.raise_for_status()
+                html = await response.text()
+
+        metrics.search_seconds.observe(time.perf_counter() - started, result="network")
+
+        video_ids = video_id_pattern.findall(html)
+        if not video_ids:
+            raise SongNotFound(f"No video found for {name.strip()}")
+
+        self.cache.put(name, video_ids[0])
+
+        return video_ids[0]
+
+    async def find_url(self, name: str) -> str:
+        """
+        Finds and returns a URL based on the provided name.
+
+        If the provided name is a URL, it will simply return it
+
+        Args:
+            name:   :class:`str`: The name or URL to search for or use as-is.
+
+        Returns:
+            str: The generated or provided URL.
+
+        """
+        if "https" in name:
+            return name.strip()
+
+        video_id = await self.search(name)
+
+        return f"{YOUTUBE_URL}/watch?v={video_id}"
+
+    async def close(self):
+        """Closes the pooled HTTP session"""
+
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import math
+import weakref
+
+import discord
+
+import settings
+from utils import guild_queue
+
+# Titles are cut so a full page always fits in the 4096 characters of an embed description
+MAX_TITLE_LENGTH = 100
+
+# The rendered pages of every queue, dropped with the queue itself
+_page_cache: weakref.WeakKeyDictionary[guild_queue.GuildQueue, tuple[int, dict[int, discord.Embed]]] = \
+    weakref.WeakKeyDictionary()
+
+
+def page_count(queue: guild_queue.GuildQueue, page_size: int = settings.QUEUE_PAGE_SIZE) -> int:
+    """Returns the number of pages of upcoming songs, the playing song is not listed"""
+
+    return max(1, math.ceil((len(queue) - 1) / page_size))
+
+
+def shorten_title(title: str) -> str:
+    title = title or "Unknown title"
+
+    return title if len(title) <= MAX_TITLE_LENGTH else title[:MAX_TITLE_LENGTH - 1] + "…"
+
+
+def render_page(queue: guild_queue.GuildQueue, page: int, page_size: int = settings.QUEUE_PAGE_SIZE) -> discord.Embed:
+    """
+    Renders one page of the upcoming songs.
+
+    Only the songs of the page are read from the queue, and the rendered page is cached until the queue changes,
+    so showing a page costs O(page size) however long the queue is.
+
+    Args:
+        queue:  :class:`guild_queue.GuildQueue`: The queue of the guild, its first entry is the playing song.
+        page:   :class:`int`: The index of the page, from 0. It is clamped to the existing pages.
+        page_size:  :class:`int`: The number of songs per page.
+
+    Returns:
+        discord.Embed: The embed of the page. It is shared with the cache and must not be modified.
+
+    """
+    pages = page_count(queue, page_size)
+    page = min(max(page, 0), pages - 1)
+
+    version, cached = _page_cache.get(queue, (None, None))
+    if version != queue.version:
+        cached = {}
+        _page_cache[queue] = (queue.version, cached)
+
+    embed_message = cached.get(page)
+    if embed_message is not None:
+        return embed_message
+
+    start = 1 + page * page_size
+
+    embed_message = discord.Embed()
+    embed_message.set_author(name=f"Queue Overview")
+
+    embed_message.title = f"🎶 Here's what's lined up in your music queue:"
+
+    embed_message.description = "".join(f"**{start + index}**. [{shorten_title(song.title)}]({song.url})\n\n"
+                                        for index, song in enumerate(queue.page(start, page_size)))
+    embed_message.set_footer(text=f"Page {page + 1}/{pages} • {len(queue) - 1} songs in the queue")
+    embed_message.colour = discord.Colour.dark_grey()
+
+    cached[page] = embed_message
+
+    return embed_message
+
+
+class QueueView(discord.ui.View):
+    """
+    The buttons browsing the pages of a queue embed.
+
+    The view only keeps the queue and the index of the page, every page is rendered (or read from the cache)
+    when a button is pressed, so the songs added or removed in the meantime are shown.
+
+    Attributes:
+        queue:  :class:`guild_queue.GuildQueue`: The queue being browsed.
+
+        page:   :class:`int`: The index of the page that is shown.
+
+        message:    :class:`discord.Message`: The message holding the view, set once it is sent.
+
+    """
+
+    def __init__(self, queue: guild_queue.GuildQueue, page: int = 0, page_size: int = settings.QUEUE_PAGE_SIZE,
+                 timeout: float = settings.QUEUE_VIEW_TIMEOUT):
+        super().__init__(timeout=timeout)
+
+        self.queue = queue
+        self.page_size = page_size
+        self.page = min(max(page, 0), page_count(queue, page_size) - 1)
+        self.message: discord.Message | None = None
+
+        self._update_buttons()
+
+    def render(self) -> discord.Embed:
+        return render_page(self.queue, self.page, self.page_size)
+
+    def _update_buttons(self):
+        last = page_count(self.queue, self.page_size) - 1
+        self.page = min(self.page, last)
+
+        self.first.disabled = self.previous.disabled = self.page == 0
+        self.next.disabled = self.last.disabled = self.page >= last
+
+    async def _show(self, interaction: discord.Interaction, page: int):
+        self.page = max(page, 0)
+        self._update_buttons()
+
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    @discord.ui.button(emoji="⏮️", style=discord.ButtonStyle.secondary)
+    async def first(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, 0)
+
+    @discord.ui.button(emoji="◀️", style=discord.ButtonStyle.secondary)
+    async def previous(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, self.page - 1)
+
+    @discord.ui.button(emoji="▶️", style=discord.ButtonStyle.secondary)
+    async def next(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, self.page + 1)
+
+    @discord.ui.button(emoji="⏭️", style=discord.ButtonStyle.secondary)
+    async def last(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, page_count(self.queue, self.page_size) - 1)
+
+    async def on_timeout(self):
+        """Disables the buttons once the view stops listening"""
+
+        for item in self.children:
+            item.disabled = True
+
+        if self.message is not None:
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException:
+                pass
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import pathlib
+import sqlite3
+import threading
+import time
+from typing import Callable, Iterable
+
+# The fields of a queued track that are checkpointed, enough to rebuild a partial song
+track_fields = ("video_id", "url", "title", "duration_seconds", "requester_id")
+
+
+class SessionStore:
+    """
+    A SQLite checkpoint of the playback sessions: the voice channel, the queue and the position in the
+    current track of every guild.
+
+    The checkpoint is incremental, an appended song is one inserted row and a finished song one deleted row.
+    The writes are queued on a single thread, so they are applied in the order the queue was changed, and
+    never block the event loop. The blocking methods are meant to be run through **submit** or **run**.
+
+    Attributes:
+        path:   :class:`pathlib.Path`: The location of the database file.
+
+    """
+
+    def __init__(self, path: str | pathlib.Path):
+        self.path = pathlib.Path(path)
+
+        self._lock = threading.Lock()
+        self._connection: sqlite3.Connection | None = None
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-store")
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.row_factory = sqlite3.Row
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "guild_id INTEGER PRIMARY KEY, channel_id INTEGER, elapsed REAL NOT NULL DEFAULT 0, updated REAL)")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS tracks ("
+                "guild_id INTEGER, position INTEGER, video_id TEXT, url TEXT, title TEXT, "
+                "duration_seconds INTEGER, requester_id INTEGER, PRIMARY KEY (guild_id, position))")
+
+        return self._connection
+
+    def submit(self, function: Callable, *args) -> concurrent.futures.Future:
+        """Queues a blocking method on the store's thread, without waiting for it"""
+
+        return self._executor.submit(function, *args)
+
+    async def run(self, function: Callable, *args):
+        """Runs a blocking method on the store's thread, after the writes queued before it"""
+
+        return await asyncio.wrap_future(self._executor.submit(function, *args))
+
+    def set_channel(self, guild_id: int, channel_id: int):
+        with self._lock:
+            connection = self._connect()
+            connection.execute("INSERT INTO sessions (guild_id, channel_id, updated) VALUES (?, ?, ?) "
+                               "ON CONFLICT(guild_id) DO UPDATE SET channel_id = excluded.channel_id, "
+                               "updated = excluded.updated", (guild_id, channel_id, time.time()))
+            connection.commit()
+
+    def set_offsets(self, offsets: Iterable[tuple[int, float]]):
+        """
+        Stores the position in the current track of several guilds at once.
+
+        Args:
+            offsets:    :class:`Iterable[tuple[int, float]]`: The guild ids and their positions, in seconds.
+
+        """
+        with self._lock:
+            connection = self._connect()
+            connection.executemany("UPDATE sessions SET elapsed = ?, updated = ? WHERE guild_id = ?",
+                                   [(offset, time.time(), guild_id) for guild_id, offset in offsets])
+            connection.commit()
+
+    def append(self, guild_id: int, track: tuple):
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                f"INSERT INTO tracks (guild_id, position, {', '.join(track_fields)}) "
+                f"SELECT ?, COALESCE(MAX(position) + 1, 0), {', '.join('?' * len(track_fields))} "
+                f"FROM tracks WHERE guild_id = ?", (guild_id, *track, guild_id))
+            connection.commit()
+
+    def advance(self, guild_id: int):
+        """Removes the first track of a guild, the position in the next one starts at 0"""
+
+        with self._lock:
+            connection = self._connect()
+            connection.execute("DELETE FROM tracks WHERE guild_id = ? AND position = "
+                               "(SELECT MIN(position) FROM tracks WHERE guild_id = ?)", (guild_id, guild_id))
+            connection.execute("UPDATE sessions SET elapsed = 0 WHERE guild_id = ?", (guild_id,))
+            connection.commit()
+
+    def replace(self, guild_id: int, tracks: list[tuple]):
+        """Rewrites the whole queue of a guild, after the changes that are not at its ends"""
+
+        with self._lock:
+            connection = self._connect()
+            connection.execute("DELETE FROM tracks WHERE guild_id = ?", (guild_id,))
+            connection.executemany(
+                f"INSERT INTO tracks (guild_id, position, {', '.join(track_fields)}) "
+                f"VALUES (?, ?, {', '.join('?' * len(track_fields))})",
+                [(guild_id, position, *track) for position, track in enumerate(tracks)])
+            connection.commit()
+
+    def delete(self, guild_id: int):
+        with self._lock:
+            connection = self._connect()
+            connection.execute("DELETE FROM tracks WHERE guild_id = ?", (guild_id,))
+            connection.execute("DELETE FROM sessions WHERE guild_id = ?", (guild_id,))
+            connection.commit()
+
+    def guild_ids(self) -> list[int]:
+        """Returns the guilds that have a saved session"""
+
+        with self._lock:
+            rows = self._connect().execute("SELECT guild_id FROM sessions").fetchall()
+
+        return [row["guild_id"] for row in rows]
+
+    def load(self, guild_id: int) -> tuple[dict | None, list[dict]]:
+        """
+        Returns the saved session of a guild and its tracks, in queue order.
+
+        Returns:
+            tuple[dict | None, list[dict]]: The session (channel id and elapsed seconds) or None, and the tracks.
+
+        """
+        with self._lock:
+            connection = self._connect()
+            session = connection.execute("SELECT * FROM sessions WHERE guild_id = ?", (guild_id,)).fetchone()
+            tracks = connection.execute("SELECT * FROM tracks WHERE guild_id = ? ORDER BY position",
+                                        (guild_id,)).fetchall()
+
+        return dict(session) if session is not None else None, [dict(track) for track in tracks]
+
+    def close(self):
+        """Applies the queued writes and closes the database"""
+
+        self._executor.shutdown(wait=True)
+
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
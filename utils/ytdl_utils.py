@@ -1,10 +1,25 @@
+from __future__ import annotations
+
 import asyncio
 import datetime
-from pprint import pprint
+import itertools
+import re
+import subprocess
+import time
+import weakref
+from typing import AsyncIterator
 
 import discord
 import yt_dlp
 
+import settings
+from utils import audio
+from utils import audio_cache as audio_cache_utils
+from utils import extraction
+from utils import loudness as loudness_utils
+from utils import metadata_cache as metadata_cache_utils
+from utils import metrics
+
 ytdl_options = {
     "format": "bestaudio/best",
     "restrictfilenames": True,
@@ -17,23 +32,165 @@ ytdl_options = {
     "source_address": "0.0.0.0"
 }
 
+if settings.YTDL_EXTRACTORS is not None:
+    ytdl_options["allowed_extractors"] = list(settings.YTDL_EXTRACTORS)
+
 ffmpeg_options = {
     'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
     'options': '-vn'
 }
 
-ytdl_player = yt_dlp.YoutubeDL(ytdl_options)
-ytdl_player.add_default_info_extractors()
+# Local files from the audio cache do not need the reconnect options
+local_ffmpeg_options = {
+    'before_options': '',
+    'options': '-vn'
+}
+
+# Built on the first playlist, in the executor, so importing this module never constructs a YoutubeDL
+ytdl_player: yt_dlp.YoutubeDL | None = None
+
+extraction_backend = extraction.create_backend(settings.EXTRACTION_BACKEND, ytdl_options,
+                                               workers=settings.EXTRACTION_WORKERS,
+                                               timeout=settings.EXTRACTION_TIMEOUT,
+                                               max_jobs=settings.EXTRACTION_MAX_JOBS)
+
+metadata_cache = metadata_cache_utils.MetadataCache(settings.METADATA_DB)
+
+audio_cache = audio_cache_utils.AudioCache(settings.AUDIO_CACHE_DIR, settings.AUDIO_CACHE_MAX_BYTES,
+                                           settings.AUDIO_CACHE_PLAY_THRESHOLD, ytdl_options,
+                                           metadata_cache) if settings.AUDIO_CACHE_ENABLED else None
+
+loudness_analyzer = loudness_utils.LoudnessAnalyzer(metadata_cache, timeout=settings.LOUDNESS_ANALYSIS_TIMEOUT,
+                                                    max_pending=settings.LOUDNESS_MAX_PENDING) \
+    if settings.LOUDNESS_NORMALIZATION else None
+
+# Every ffmpeg source created for playback, they leave the set once garbage collected
+ffmpeg_sources: weakref.WeakSet[discord.FFmpegAudio] = weakref.WeakSet()
+
+
+def active_ffmpeg_processes() -> int:
+    """Counts the ffmpeg processes that are still running"""
+
+    return sum(1 for source in list(ffmpeg_sources)
+               if isinstance(getattr(source, "_process", None), subprocess.Popen) and source._process.poll() is None)
+
+
+metrics.ffmpeg_processes.function = active_ffmpeg_processes
+
+video_id_pattern = re.compile(r'(?:[?&]v=|youtu\.be/|/shorts/)([\w-]{11})')
+
+
+def parse_video_id(url: str) -> str | None:
+    """
+    Returns the YouTube video id contained in a URL, or None if the URL does not point to a video.
+    """
+    match = video_id_pattern.search(url)
+
+    return match.group(1) if match else None
+
+
+def metadata_from_info(data: dict) -> dict:
+    """
+    Keeps only the fields of an extraction record that are needed to build a :class:`Song`.
+    """
+    return {
+        "title": data["title"],
+        "thumbnail": data["thumbnail"],
+        "likes": data["like_count"],
+        "views": data["view_count"],
+        "duration": data["duration_string"],
+        "duration_seconds": data["duration"],
+        "date": data["upload_date"],
+        "channel": data["uploader"],
+        "channel_url": data["uploader_url"]
+    }
+
+
+def song_from_entry(entry: dict, requester=None) -> Song:
+    """
+    Builds a partial :class:`Song` from a flat playlist entry.
+
+    Only the title, the duration and the channel are known at this point, the rest of the metadata and the
+    stream URL are filled in by **YTDLSource.from_song** when the song approaches the head of the queue.
+    """
+    duration_seconds = entry.get("duration")
+
+    return Song(None, "https://www.youtube.com/watch?v=" + entry["id"],
+                title=entry.get("title"), duration_seconds=duration_seconds, thumbnail=None,
+                likes=None, views=None,
+                duration=yt_dlp.utils.formatSeconds(duration_seconds) if duration_seconds else None,
+                date=None, channel=entry.get("channel") or entry.get("uploader"),
+                channel_url=entry.get("channel_url") or entry.get("uploader_url"), requester=requester,
+                video_id=entry["id"], partial=True)
+
+
+def playlist_ytdl() -> yt_dlp.YoutubeDL:
+    """Returns the YoutubeDL instance extracting the playlists, building it on the first call"""
+
+    global ytdl_player
+
+    if ytdl_player is None:
+        ytdl_player = yt_dlp.YoutubeDL(ytdl_options)
+
+    return ytdl_player
+
+
+async def iter_playlist(url, loop=None, requester=None, page_size=50) -> AsyncIterator[Song]:
+    """
+    Streams the entries of a playlist as partial songs.
+
+    The playlist is extracted flat and its entries are pulled page by page in the executor, so the first song
+    is available after the first page and the full info dicts of the entries are never built.
+
+    Args:
+        url:    :class:`str`: The URL of the playlist.
+        loop:   :class:`asyncio.AbstractEventLoop`: The loop used to run the extraction in an executor.
+        requester:  :class:`discord.Member`: The member who requested the playlist.
+        page_size:  :class:`int`: The number of entries pulled from the extractor at a time.
+
+    Yields:
+        Song: The partial songs, in playlist order.
+
+    """
+    loop = loop or asyncio.get_event_loop()
+
+    data = await loop.run_in_executor(None, lambda: playlist_ytdl().extract_info(url, download=False,
+                                                                                 process=False))
+    entries = iter((data or {}).get("entries") or ())
+
+    while True:
+        page = await loop.run_in_executor(None, lambda: list(itertools.islice(entries, page_size)))
+        if not page:
+            return
+
+        for entry in page:
+            if entry and entry.get("id"):
+                yield song_from_entry(entry, requester)
 
 
 class Song:
-    def __init__(self, source, url, title, description, duration_seconds, thumbnail, likes, views,
-                 duration, date, channel, channel_url, requester, loop):
+    """
+    The compact record of a queued song.
+
+    Only the fields rendered by the music embeds are kept, in slots, the info dict it was built from is not
+    referenced anymore. **source** is the direct stream URL, it can be None until the song is about to play.
+    """
+
+    __slots__ = ("source", "codec", "loudness", "url", "video_id", "partial", "title", "duration",
+                 "duration_seconds", "date", "likes", "views", "thumbnail", "channel", "channel_url", "start_time",
+                 "requester")
+
+    def __init__(self, source, url, title, duration_seconds, thumbnail, likes, views,
+                 duration, date, channel, channel_url, requester, video_id=None, partial=False, codec=None,
+                 loudness=None):
         self.source = source
+        self.codec = codec
+        self.loudness = loudness
         self.url = url
+        self.video_id = video_id
+        self.partial = partial
 
         self.title = title
-        self.description = description
         self.duration = duration
         self.duration_seconds = duration_seconds
         self.date = date
@@ -47,41 +204,199 @@ class Song:
 
         self.start_time = datetime.datetime.now()
         self.requester = requester
-        self.is_looping = loop
 
 
-class YTDLSource(discord.PCMVolumeTransformer):
-    def __init__(self, source, *, song: Song, volume=0.5):
+def playback_volume(song: Song) -> float:
+    """
+    Returns the volume a song is played at: the default volume, corrected by the song's loudness if it is known.
+    """
+    volume = settings.DEFAULT_VOLUME
+
+    if settings.LOUDNESS_NORMALIZATION and song.loudness is not None:
+        volume *= loudness_utils.gain_for(song.loudness, settings.LOUDNESS_TARGET, settings.LOUDNESS_MAX_GAIN)
+
+    return volume
+
+
+async def analyze_loudness(song: Song, loop=None):
+    """
+    Measures the loudness of a song in the background if it was never measured.
+
+    The file of the audio cache is measured when there is one. The stream is only measured when
+    **LOUDNESS_ANALYZE_STREAMS** is set, and only over its first **LOUDNESS_STREAM_WINDOW** seconds: it is
+    downloaded and decoded a second time.
+    """
+    if loudness_analyzer is None or song.loudness is not None or not song.video_id:
+        return
+
+    loop = loop or asyncio.get_event_loop()
+
+    local = await loop.run_in_executor(None, audio_cache.lookup, song.video_id) if audio_cache is not None else None
+    if local is not None:
+        await loudness_analyzer.analyze(song.video_id, str(local[0]), local_ffmpeg_options["before_options"], loop)
+    elif settings.LOUDNESS_ANALYZE_STREAMS and song.source is not None:
+        await loudness_analyzer.analyze(song.video_id, song.source, ffmpeg_options["before_options"], loop,
+                                        window=settings.LOUDNESS_STREAM_WINDOW)
+
+
+class OpusPassthroughSource(discord.FFmpegOpusAudio):
+    """
+    Plays an Opus stream without decoding it to PCM.
+
+    At unit volume the packets are copied as they are, otherwise ffmpeg applies the volume and re-encodes
+    the stream itself, which is still cheaper than decoding, scaling and encoding every frame in the bot.
+    """
+
+    def __init__(self, source, *, song: Song, volume=1.0, before_options=ffmpeg_options["before_options"],
+                 options=ffmpeg_options["options"]):
+        if volume != 1.0:
+            options += f" -af volume={volume:.3f}"
+
+        super().__init__(source, codec="copy" if volume == 1.0 else None,
+                         before_options=before_options, options=options)
+
+        self.song = song
+        self.volume = volume
+
+
+class YTDLSource(audio.GainTransformer):
+    def __init__(self, source, *, song: Song, volume=settings.DEFAULT_VOLUME):
         super().__init__(source, volume)
 
         self.song = song
 
     @classmethod
-    async def fetch_video_data(cls, url, loop=None, stream=True, requester=None):
+    async def fetch_video_data(cls, url, loop=None, stream=True, requester=None) -> Song:
+        """
+        Fetches the metadata of a video and returns it as a lightweight :class:`Song`.
+
+        No audio source is created here, the ffmpeg process is only spawned by **from_song** once the song
+        reaches the head of the queue. The stream URL found while extracting is kept on the song, but it
+        is not required: a song coming from the metadata cache may have none.
+
+        Args:
+            url:    :class:`str`: The URL of the video.
+            loop:   :class:`asyncio.AbstractEventLoop`: The loop used to run the extraction in an executor.
+            stream: :class:`bool`: Whether the audio is streamed or downloaded.
+            requester:  :class:`discord.Member`: The member who requested the song.
+
+        Returns:
+            Song: The song descriptor to queue.
+
+        """
         loop = loop or asyncio.get_event_loop()
+        started = time.perf_counter()
+
+        video_id = parse_video_id(url)
+        record = await loop.run_in_executor(None, metadata_cache.get, video_id) if video_id and stream else None
+
+        if record is not None:
+            source = record["stream_url"]
+            codec = record["stream_codec"]
+            loudness = record["loudness"]
+            metadata = {field: record[field] for field in metadata_cache_utils.metadata_fields}
+        else:
+            data = await extraction_backend.extract(url, download=not stream)
+
+            video_id = data["id"]
+            source = data["url"]
+            codec = data["acodec"]
+            loudness = None
+            metadata = metadata_from_info(data)
+
+            await loop.run_in_executor(None, metadata_cache.put, video_id, metadata, source, codec)
+
+        metrics.extraction_seconds.observe(time.perf_counter() - started,
+                                           source="cache" if record is not None else "extractor")
+
+        url = "https://www.youtube.com/watch?v=" + video_id
+
+        return Song(source, url, requester=requester, video_id=video_id, codec=codec, loudness=loudness, **metadata)
+
+    @classmethod
+    async def from_song(cls, song: Song, loop=None, offset: float = 0.0) -> discord.AudioSource:
+        """
+        Creates the playable audio source of a queued song.
+
+        Opus streams are played through :class:`OpusPassthroughSource` when **OPUS_PASSTHROUGH** is enabled,
+        every other stream is decoded to PCM. Either way the ffmpeg output is read ahead into a ring buffer.
+
+        A file from the audio cache is preferred to the stream when there is one. Otherwise the stream URL is
+        re-extracted first if the song has none or if it expired while the song was waiting. A partial song
+        coming from a playlist gets its full metadata at this point, from the cache if possible.
+
+        Args:
+            song:   :class:`Song`: The song that is about to be played.
+            loop:   :class:`asyncio.AbstractEventLoop`: The loop used to run the extraction in an executor.
+            offset: :class:`float`: The number of seconds to skip at the start of the song.
+
+        Returns:
+            discord.AudioSource: The audio source, with its ffmpeg process started.
+
+        """
+        loop = loop or asyncio.get_event_loop()
+
+        if song.partial or song.loudness is None:
+            record = await loop.run_in_executor(None, metadata_cache.get, song.video_id)
+
+            if record is not None:
+                song.loudness = record["loudness"]
+
+            if record is not None and song.partial:
+                for field in metadata_cache_utils.metadata_fields:
+                    setattr(song, field, record[field])
+                song.source = record["stream_url"]
+                song.codec = record["stream_codec"]
+                song.partial = False
+
+        local = await loop.run_in_executor(None, audio_cache.lookup, song.video_id) \
+            if audio_cache is not None and song.video_id else None
+
+        if song.partial or (local is None and (song.source is None or
+                                               metadata_cache_utils.stream_expiry(song.source) < time.time())):
+            data = await extraction_backend.extract(song.url)
+            song.source = data["url"]
+            song.codec = data["acodec"]
+
+            if song.partial:
+                metadata = metadata_from_info(data)
+                for field, value in metadata.items():
+                    setattr(song, field, value)
+                song.partial = False
+
+                await loop.run_in_executor(None, metadata_cache.put, data["id"], metadata, song.source,
+                                           song.codec)
+            else:
+                await loop.run_in_executor(None, metadata_cache.update_stream, data["id"], song.source,
+                                           song.codec)
+
+        if local is not None:
+            location, codec = str(local[0]), local[1]
+            options = local_ffmpeg_options
+        else:
+            location, codec = song.source, song.codec
+            options = ffmpeg_options
+
+        if offset > 0:
+            # Seeking before the input lets ffmpeg skip the start of the stream without decoding it
+            options = dict(options, before_options=f"{options.get('before_options', '')} -ss {offset:.3f}".strip())
+
+        volume = playback_volume(song)
+
+        if settings.OPUS_PASSTHROUGH and codec == "opus":
+            # Small corrections are not worth losing the codec copy
+            if abs(loudness_utils.gain_db(volume)) <= settings.LOUDNESS_PASSTHROUGH_TOLERANCE_DB:
+                volume = 1.0
+
+            source = OpusPassthroughSource(location, song=song, volume=volume, **options)
+        else:
+            source = discord.FFmpegPCMAudio(location, **options)
+
+        ffmpeg_sources.add(source)
+        buffered = audio.BufferedAudio(source, depth=settings.READAHEAD_FRAMES,
+                                       on_first_frame=metrics.ffmpeg_startup_seconds.observe)
 
-        data = await loop.run_in_executor(None, lambda: ytdl_player.extract_info(url, download=not stream))
-        # pprint(data)
-
-        source = data["url"]
-        url = "https://www.youtube.com/watch?v=" + data["id"]
-        title = data["title"]
-        description = data["description"]
-        thumbnail = data["thumbnail"]
-        likes = data["like_count"]
-        views = data["view_count"]
-        duration = data["duration_string"]
-        duration_seconds = data["duration"]
-        date = data["upload_date"]
-        channel = data["uploader"]
-        channel_url = data["uploader_url"]
-
-        song = Song(
-            source, url, title, description, duration_seconds, thumbnail, likes, views,
-            duration, date, channel, channel_url, requester, loop)
-
-        return cls(
-            discord.FFmpegPCMAudio(source, **ffmpeg_options), song=song)
+        return buffered if source.is_opus() else cls(buffered, song=song, volume=volume)
 
     def __getitem__(self, item):
         return self